@@ -0,0 +1,339 @@
+"""
+Timing and memory benchmarks of the numerical hot paths, on synthetic data.
+
+Each case builds its inputs once and runs once (outside the timing), then times the best of several runs and
+measures the peak memory of one more run with tracemalloc. Results are appended to a history file, one JSON object
+per line, and compared against a stored baseline; a case more than the tolerance slower, or larger in peak memory,
+than its baseline is flagged as a regression and the script exits with status 1.
+
+    python benchmarks.py                          # all cases at 1e5, 1e6 and 1e7 points
+    python benchmarks.py --sizes 1e8 --cases interp_resample gaussian_filter
+    python benchmarks.py --save-baseline          # store this run as the new baseline
+
+The text fixtures for open_cross_section are kept in the fixture directory between runs, since writing them takes
+longer than reading them.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+default_history = 'benchmark_history.jsonl'
+default_baseline = 'benchmark_baseline.json'
+default_fixture_dir = os.path.join(tempfile.gettempdir(), 'balloon_hires_benchmarks')
+
+
+def _cross_section_fixture(size, fixture_dir):
+    # ascending wavenumbers, the order spectrum_calcs.py and the streaming reader of open_cross_section expect
+    filename = os.path.join(fixture_dir, f'cross_section_{size}.txt')
+    if not os.path.exists(filename):
+        os.makedirs(fixture_dir, exist_ok=True)
+        rng = np.random.default_rng(size)
+        wave_numbers = np.linspace(4000., 10000., size)
+        cross_sections = 10**rng.uniform(-26, -20, size)
+        with open(filename + '.tmp', 'w') as file:
+            for start in range(0, size, 2**20):
+                block = np.column_stack((wave_numbers[start:start + 2**20], cross_sections[start:start + 2**20]))
+                np.savetxt(file, block, fmt='%.6f %.6e')
+        os.replace(filename + '.tmp', filename)
+    return filename
+
+
+def _spectrum(size):
+    # ascending wavelength in um, with a transmission-like spectrum of narrow lines
+    rng = np.random.default_rng(size)
+    wavelength = np.linspace(1.45, 2.6, size)
+    spectrum = 1 - 0.5*rng.random(size)**50
+    return wavelength, spectrum
+
+
+def bench_open_cross_section(size, fixture_dir):
+    from toolkit import open_cross_section
+
+    filename = _cross_section_fixture(size, fixture_dir)
+    return lambda: open_cross_section(filename, cache=False)
+
+
+def bench_open_cross_section_cached(size, fixture_dir):
+    from toolkit import open_cross_section
+
+    filename = _cross_section_fixture(size, fixture_dir)
+    open_cross_section(filename, cache=True, cache_dir=fixture_dir)  # build the binary copy outside the timing
+    return lambda: open_cross_section(filename, wn_range=(5000., 6000.), cache=True, cache_dir=fixture_dir)
+
+
+def bench_open_cross_section_stream(size, fixture_dir):
+    from toolkit import open_cross_section
+
+    filename = _cross_section_fixture(size, fixture_dir)
+    return lambda: open_cross_section(filename, wn_range=(5000., 6000.), stream=True)
+
+
+def _slice_windows(size, n_slices=1000):
+    wavelength, spectrum = _spectrum(size)
+    starts = np.random.default_rng(0).uniform(1.45, 2.5, n_slices)
+    return wavelength, spectrum, starts
+
+
+def bench_spectrum_slicer(size, fixture_dir):
+    from toolkit import spectrum_slicer
+
+    wavelength, spectrum, starts = _slice_windows(size)
+    dataset = np.column_stack((wavelength, spectrum))
+    return lambda: [spectrum_slicer(start, start + 0.05, dataset) for start in starts]
+
+
+def bench_spectrum_slicer_old(size, fixture_dir):
+    from toolkit import spectrum_slicer_old
+
+    wavelength, spectrum, starts = _slice_windows(size)
+    return lambda: [spectrum_slicer_old(start, start + 0.05, wavelength, spectrum) for start in starts]
+
+
+def bench_window_indices(size, fixture_dir):
+    # the same 1000 windows in one batched call
+    from toolkit import window_indices
+
+    wavelength, spectrum, starts = _slice_windows(size)
+    return lambda: window_indices(wavelength, starts, starts + 0.05)
+
+
+def bench_gaussian_filter(size, fixture_dir):
+    # the smoothing step of signal_noise_calcs.py before smooth_to_resolution: one constant-width gaussian
+    from scipy.ndimage import gaussian_filter
+
+    wavelength, spectrum = _spectrum(size)
+    sigma = np.mean(wavelength)/40000/np.mean(np.diff(wavelength))/(2*np.sqrt(2*np.log(2)))
+    return lambda: gaussian_filter(spectrum, sigma)
+
+
+def bench_gaussian_filter_out_of_core(size, fixture_dir):
+    # the same filter, chunked over a memory-mapped copy of the spectrum
+    from smoothing import gaussian_filter_out_of_core
+
+    wavelength, spectrum = _spectrum(size)
+    os.makedirs(fixture_dir, exist_ok=True)
+    source_file = os.path.join(fixture_dir, f'spectrum_{size}.npy')
+    np.save(source_file, spectrum)
+    source = np.load(source_file, mmap_mode='r')
+    sigma = np.mean(wavelength)/40000/np.mean(np.diff(wavelength))/(2*np.sqrt(2*np.log(2)))
+    return lambda: gaussian_filter_out_of_core(source, sigma, os.path.join(fixture_dir, f'smoothed_{size}.npy'),
+                                               chunk_size=2**20)
+
+
+def bench_smooth_to_resolution_out_of_core(size, fixture_dir):
+    # the same smoothing, chunked over memory-mapped copies of the wavelengths and the spectrum
+    from smoothing import smooth_to_resolution_out_of_core
+
+    wavelength, spectrum = _spectrum(size)
+    os.makedirs(fixture_dir, exist_ok=True)
+    files = [os.path.join(fixture_dir, f'{name}_{size}.npy') for name in ('wavelength', 'spectrum')]
+    np.save(files[0], wavelength)
+    np.save(files[1], spectrum)
+    return lambda: smooth_to_resolution_out_of_core(files[0], files[1], 40000,
+                                                    os.path.join(fixture_dir, f'smoothed_R_{size}.npy'),
+                                                    chunk_size=2**20)
+
+
+def bench_smooth_to_resolution(size, fixture_dir):
+    from smoothing import smooth_to_resolution
+
+    wavelength, spectrum = _spectrum(size)
+    return lambda: smooth_to_resolution(wavelength, spectrum, 40000)
+
+
+def _sigma_trace(size):
+    # (n_species, n_wavelength) cross-sections of one species, the layout z_lambda sums over
+    return 10**np.random.default_rng(size).uniform(-26, -20, size)[None, :]
+
+
+def bench_z_lambda(size, fixture_dir):
+    from transit_model import z_lambda
+
+    sigma_trace = _sigma_trace(size)
+    # water in H2 at 1500 K, the spectrum_calcs.py case
+    return lambda: z_lambda(sigma_trace, np.array([[10**-3.8]]), 1., 1.21, 2.3, 1500., 30., sigma_filler=1e-31)
+
+
+def bench_z_lambda_batch(size, fixture_dir, n_models=8):
+    # the same atmosphere at n_models water abundances in one call
+    from transit_model import z_lambda_batch
+
+    sigma_trace = _sigma_trace(size)
+    xi = np.logspace(-5, -3, n_models)[:, None]
+    return lambda: z_lambda_batch(sigma_trace, xi, 1., 1.21, 2.3, 1500., 30., sigma_filler=1e-31)
+
+
+def bench_B_lambda(size, fixture_dir):
+    import astropy.units as u
+    from radiometry import B_lambda
+
+    wavelength = np.linspace(1.45e-6, 2.6e-6, size)*u.m
+    return lambda: B_lambda(wavelength, 2100*u.K)
+
+
+def bench_planck_lambda(size, fixture_dir):
+    from radiometry import planck_lambda
+
+    wavelength = np.linspace(1.45e-6, 2.6e-6, size)
+    return lambda: planck_lambda(wavelength, 2100.)
+
+
+def bench_interp_resample(size, fixture_dir):
+    # instrument_plots.py: McMurdo radiance (coarse) onto the OH line grid (fine)
+    coarse_wl, coarse_em = _spectrum(max(size//10, 2))
+    fine_wl = np.sort(np.random.default_rng(1).uniform(1.45, 2.6, size))
+    return lambda: np.interp(fine_wl, coarse_wl, coarse_em)
+
+
+def bench_rebin_resample(size, fixture_dir):
+    # the same resampling with the flux-conserving rebinning matrix, once it is cached
+    from rebinning import rebin
+
+    coarse_wl, coarse_em = _spectrum(max(size//10, 2))
+    fine_wl = np.sort(np.random.default_rng(1).uniform(1.45, 2.6, size))
+    rebin(coarse_wl, fine_wl, coarse_em)
+    return lambda: rebin(coarse_wl, fine_wl, coarse_em)
+
+
+cases = {
+    'open_cross_section': bench_open_cross_section,
+    'open_cross_section_cached': bench_open_cross_section_cached,
+    'open_cross_section_stream': bench_open_cross_section_stream,
+    'spectrum_slicer': bench_spectrum_slicer,
+    'spectrum_slicer_old': bench_spectrum_slicer_old,
+    'window_indices': bench_window_indices,
+    'gaussian_filter': bench_gaussian_filter,
+    'gaussian_filter_out_of_core': bench_gaussian_filter_out_of_core,
+    'smooth_to_resolution': bench_smooth_to_resolution,
+    'smooth_to_resolution_out_of_core': bench_smooth_to_resolution_out_of_core,
+    'z_lambda': bench_z_lambda,
+    'z_lambda_batch': bench_z_lambda_batch,
+    'B_lambda': bench_B_lambda,
+    'planck_lambda': bench_planck_lambda,
+    'interp_resample': bench_interp_resample,
+    'rebin_resample': bench_rebin_resample,
+}
+
+
+def run_case(name, size, fixture_dir=default_fixture_dir, repeat=3):
+    '''
+    Time one case at one size.
+
+    Returns
+    -------
+    dict with the case, size, best wall time in seconds over repeat runs, and the peak traced memory in MB of one
+    further run
+    '''
+    func = cases[name](size, fixture_dir)
+    # one untimed call, so lazy imports and first-call caches do not land in the timings
+    func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'case': name, 'size': size, 'seconds': min(times), 'peak_mb': peak/2**20}
+
+
+def _revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _key(result):
+    return f'{result["case"]}@{result["size"]}'
+
+
+def compare(results, baseline, time_tolerance=0.25, memory_tolerance=0.25):
+    '''
+    Flag results slower or larger than their baseline entry by more than the tolerances (fractions).
+
+    Adds 'regression' (list of 'time'/'memory', empty if none), and the baseline ratios where there is a baseline
+    entry, to each result. Returns the results that regressed.
+    '''
+    regressed = []
+    for result in results:
+        result['regression'] = []
+        reference = baseline.get(_key(result))
+        if reference is None:
+            continue
+        result['time_ratio'] = result['seconds']/reference['seconds']
+        result['memory_ratio'] = result['peak_mb']/reference['peak_mb'] if reference['peak_mb'] else 1.
+        if result['time_ratio'] > 1 + time_tolerance:
+            result['regression'].append('time')
+        if result['memory_ratio'] > 1 + memory_tolerance:
+            result['regression'].append('memory')
+        if result['regression']:
+            regressed.append(result)
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='+', choices=list(cases), default=list(cases))
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1e5, 1e6, 1e7])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--history', default=default_history)
+    parser.add_argument('--baseline', default=default_baseline)
+    parser.add_argument('--save-baseline', action='store_true', help='store the results of this run as the baseline')
+    parser.add_argument('--time-tolerance', type=float, default=0.25)
+    parser.add_argument('--memory-tolerance', type=float, default=0.25)
+    parser.add_argument('--fixture-dir', default=default_fixture_dir)
+    args = parser.parse_args(argv)
+
+    run = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'revision': _revision(), 'host': platform.node(),
+           'python': platform.python_version(), 'numpy': np.__version__}
+    results = []
+    for size in (int(size) for size in args.sizes):
+        for name in args.cases:
+            try:
+                result = run_case(name, size, fixture_dir=args.fixture_dir, repeat=args.repeat)
+            except ImportError as error:
+                print(f'{name:>28} {size:>10}  skipped: {error}')
+                continue
+            results.append(result)
+            print(f'{name:>28} {size:>10}  {result["seconds"]*1e3:10.2f} ms  {result["peak_mb"]:9.1f} MB')
+
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    except (OSError, ValueError):
+        baseline = {}
+    regressed = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+
+    with open(args.history, 'a') as file:
+        for result in results:
+            file.write(json.dumps({**run, **result}) + '\n')
+
+    if args.save_baseline:
+        baseline.update({_key(result): {'seconds': result['seconds'], 'peak_mb': result['peak_mb'], **run}
+                         for result in results})
+        with open(args.baseline, 'w') as file:
+            json.dump(baseline, file, indent=1)
+
+    for result in regressed:
+        print(f'REGRESSION {_key(result)}: {", ".join(result["regression"])} '
+              f'(time x{result["time_ratio"]:.2f}, memory x{result["memory_ratio"]:.2f})')
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,184 @@
+"""
+Photon budgets and cross-correlation S/N estimates for the feasibility study.
+
+These are the calculations behind sensitivity_calcs.py, instrument_plots.py and signal_noise_calcs.py, on plain
+floats, so batch jobs can run them without matplotlib, astropy or the data files. Wavelengths are in um unless the
+parameter says otherwise, and photon fluxes are per second, per um of wavelength and per m^2 of collecting area.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from radiometry import photon_flux_lambda, planck_lambda, planck_lambda_grid, h, c
+from orbits import orbital_velocity, delta_t_max
+from toolkit import build_line_index, n_lines, snr_calculator, snr_sweep
+
+arcsec2_per_sr = (np.degrees(1.)*3600)**2
+# (R_star/distance)^2 of WASP-76: 1.97 solar radii at 190 pc
+wasp76_dilution = (1.97 * 6.95700e8 / (190 * 3.0857e16))**2
+
+igrins_bands = ((1.47, 1.8), (1.96, 2.46))  # um, the H and K windows
+
+
+def pixel_sky_area(angle, px_sampling=2):
+    '''
+    Sky area of a pixel, in arcsec^2, for a resolution element of angle radians sampled by px_sampling pixels.
+
+    Uses 4.25e10 arcsec^2/sr, as instrument_plots.py always has.
+    '''
+    return np.pi/4 * (angle/px_sampling)**2 * 4.25e10
+
+
+def blackbody_photons(wavelength, rp_rstar, temperatures=(2100, 6100), dilution=wasp76_dilution, fudge=3,
+                      px_sampling=2):
+    '''
+    Blackbody photon fluxes of a planet and its host star at Earth, per pixel.
+
+    Parameters
+    ----------
+    wavelength: array
+        um
+    rp_rstar: float
+        Ratio of the planet radius to the star radius
+    temperatures: tuple
+        (planet, star) temperatures in K
+    dilution: float
+        (R_star/distance)^2
+    fudge: float
+        Extra factor on the planet flux, which makes it match the star signal
+    px_sampling: float
+        Pixels per resolution element along each axis; the flux is spread over px_sampling^2 pixels
+
+    Returns
+    -------
+    planet, star: arrays
+        photons/s/um/m^2 per pixel
+    '''
+    planet, star = planck_lambda_grid(np.asarray(wavelength)*1e-6, temperatures, photons=True) * 1e-6 * dilution
+    planet *= rp_rstar**2 * fudge
+    return planet/px_sampling**2, star/px_sampling**2
+
+
+FluxBudget = namedtuple('FluxBudget', ['ground_mirror', 'balloon_mirror', 'ground_sky', 'balloon_sky', 'star_px',
+                                       'planet_px', 'orbital_velocity', 'max_exposure', 'telescope_area'])
+FluxBudget.__doc__ = '''
+Photon budget of one pixel at a single wavelength, from flux_budget.
+
+ground_mirror, balloon_mirror: thermal emission of the primary mirror, photons/s/um/m^2 per pixel
+ground_sky, balloon_sky: sky background, photons/s/um/m^2 per pixel
+star_px, planet_px: star and planet signal in one pixel, photons/s/m^2
+orbital_velocity: K_p, m/s
+max_exposure: longest exposure before the planet lines smear by half a resolution element, s
+telescope_area: collecting area of the balloon telescope, m^2
+'''
+
+
+def flux_budget(wavelength=2159e-9, emissivity=0.02, ground_mirror_T=280., balloon_mirror_T=250., slit_width=0.34,
+                balloon_diameter=1.2, sky_background=1e5, star_flux=2.16e-13, planet_T=2160., rp_rstar=0.109,
+                dilution=wasp76_dilution, fudge=3, R=40000, period=1.810, m_star=0.78):
+    '''
+    Photon budget of a pixel at Gemini and on a balloon, for a hot Jupiter (WASP-76 b by default).
+
+    Parameters
+    ----------
+    wavelength: float
+        m
+    emissivity: float
+        Emissivity of the primary mirror
+    ground_mirror_T, balloon_mirror_T: float
+        Mirror temperatures, K
+    slit_width: float
+        Slit width at Gemini, arcsec, sampled by 2 pixels
+    balloon_diameter: float
+        m. The balloon pixels are half the diffraction limit wavelength/diameter.
+    sky_background: float
+        Sky emission, photons/s/um/arcsec^2/m^2, at both sites
+    star_flux: float
+        Flux of the host star at wavelength, W/m^2/um
+    planet_T: float
+        Equilibrium temperature of the planet, K. The planet is a blackbody with no features or phase dependence.
+    rp_rstar, dilution, fudge: float
+        See blackbody_photons
+    R: float
+        Resolving power, Nyquist sampled
+    period: float
+        Orbital period, days
+    m_star: float
+        Mass of the host star, solar masses
+
+    Returns
+    -------
+    FluxBudget
+    '''
+    wl_um = wavelength*1e6
+    px_bin = 0.5*wl_um/R  # um per pixel
+
+    omega_ground = np.pi/4 * np.radians(slit_width/2/3600)**2  # sr
+    omega_balloon = np.pi/4 * (wavelength/balloon_diameter/2)**2
+    ground_mirror = photon_flux_lambda(wavelength, ground_mirror_T) * emissivity * omega_ground * 1e-6
+    balloon_mirror = photon_flux_lambda(wavelength, balloon_mirror_T) * emissivity * omega_balloon * 1e-6
+    ground_sky = sky_background * omega_ground*arcsec2_per_sr
+    balloon_sky = sky_background * omega_balloon*arcsec2_per_sr
+
+    star_px = star_flux * wavelength/(h*c) * px_bin
+    # the planet radiance is diluted like a point source, and the fudge factor makes it match the star signal
+    planet_flux = planck_lambda(wavelength, planet_T) * 1e-6 * dilution * rp_rstar**2 * fudge
+    planet_px = planet_flux * wavelength/(h*c) * px_bin
+
+    t_orb = period*86400
+    k_p = orbital_velocity(t_orb, m_star)
+    return FluxBudget(ground_mirror, balloon_mirror, ground_sky, balloon_sky, star_px, planet_px, k_p,
+                      delta_t_max(k_p, t_orb, R=R), np.pi*(balloon_diameter/2)**2)
+
+
+SnrEstimates = namedtuple('SnrEstimates', ['band', 'igrins', 'platforms', 'index'])
+SnrEstimates.__doc__ = '''
+Cross-correlation S/N estimates, from cc_snr_estimates.
+
+band: S/N at the reference telescope, from the lines in one band
+igrins: S/N at the reference telescope, from the IGRINS H and K windows
+platforms: toolkit.SweepResult over the 'platform' axis
+index: the toolkit.LineIndex of the transmission spectrum, for further bands
+'''
+
+
+def cc_snr_estimates(wavelength, transmission, snr_ref, r_ref, exposure_time, contrast, band=(1.56, 1.62),
+                     platform_band=(1.47, 2.5), platforms=None):
+    '''
+    Cross-correlation S/N of a planet with the line depths of a transmission spectrum, scaled from a reference S/N.
+
+    Parameters
+    ----------
+    wavelength, transmission: arrays
+        Transmission spectrum, already smoothed to the instrument resolution
+    snr_ref: float
+        S/N of the host star per bin in a 120 s exposure at the reference telescope
+    r_ref: float
+        Aperture radius of the reference telescope, m
+    exposure_time: float
+        s
+    contrast: float
+        Planet/star contrast
+    band: tuple
+        (start, end) of the band for the band estimate, um
+    platform_band: tuple
+        (start, end) of the band covered by the platforms, um
+    platforms: dict, optional
+        Platform name to aperture radius in m. Defaults to Superbit (0.5 m) and Gigabit (1.35 m).
+
+    Returns
+    -------
+    SnrEstimates
+    '''
+    if platforms is None:
+        platforms = {'Superbit': 0.5/2, 'Gigabit': 1.35/2}
+    index = build_line_index(wavelength, transmission)
+
+    snr_band = snr_calculator(snr_ref, exposure_time, r_ref, contrast, n_lines(index, band), r_ref=r_ref)
+    # the IGRINS estimate has always summed the line depth, not its square
+    snr_igrins = snr_calculator(snr_ref, exposure_time, r_ref, contrast,
+                                np.sum(n_lines(index, igrins_bands, power=1)), r_ref=r_ref)
+    snr_platforms = snr_sweep(snr_ref, r_ref, ('platform', list(platforms.values())), exposure_time, contrast,
+                              n_lines(index, platform_band), coords={'platform': list(platforms)})
+    return SnrEstimates(snr_band, snr_igrins, snr_platforms, index)
@@ -0,0 +1,194 @@
+"""
+Cross-correlation S/N simulation.
+
+Checks the analytic N_lines scaling (snr_calculator, spectrum_calcs.txt) against an actual cross-correlation. Spectra
+are put on a grid uniform in log-wavelength, where a Doppler shift is a constant shift in pixels, so the CCF of every
+exposure over the whole velocity grid is one batched FFT. The CCFs are then co-added along planet trajectories
+v = v_sys + K_p sin(2 pi phase) into a Kp-Vsys detection map.
+
+Velocities are in m/s.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import numpy as np
+
+from radiometry import c  # m/s
+
+
+def log_wavelength_grid(wl_start, wl_end, R_sampling):
+    '''
+    Wavelength grid uniform in log-wavelength, with wl/delta-wl = R_sampling between samples.
+
+    Returns
+    -------
+    wavelength: array
+    dv: float
+        Velocity step of one pixel, in m/s
+    '''
+    step = np.log1p(1/R_sampling)
+    n = int(np.floor(np.log(wl_end/wl_start)/step)) + 1
+    return wl_start*np.exp(step*np.arange(n)), c*np.expm1(step)
+
+
+def to_log_grid(log_grid, wavelength, spectrum):
+    # linear interpolation; wavelength may be ascending or descending
+    wavelength = np.asarray(wavelength)
+    if wavelength[0] > wavelength[-1]:
+        wavelength = wavelength[::-1]
+        spectrum = np.asarray(spectrum)[..., ::-1]
+    return np.interp(log_grid, wavelength, spectrum) if np.ndim(spectrum) == 1 else \
+        np.stack([np.interp(log_grid, wavelength, row) for row in spectrum])
+
+
+def doppler_shift(log_grid, spectrum, velocities):
+    '''
+    Shift a spectrum on a log-wavelength grid by each of velocities, with linear interpolation.
+
+    Returns
+    -------
+    (n_velocities, n_pixels) array. Pixels shifted in from off the grid take the edge value.
+    '''
+    velocities = np.atleast_1d(velocities)
+    # a source moving at v is seen at wl*(1 + v/c), so sample the rest frame spectrum at wl/(1 + v/c)
+    rest_wl = log_grid[None, :]/(1 + velocities[:, None]/c)
+    return np.interp(rest_wl, log_grid, spectrum)
+
+
+def ccf(exposures, template, dv, max_velocity, workers=-1):
+    '''
+    Cross-correlate every exposure with a template, over all shifts up to max_velocity, with one batched FFT.
+
+    Parameters
+    ----------
+    exposures: array
+        (n_exposures, n_pixels) spectra on the log-wavelength grid, with the star and telluric lines already removed
+    template: array
+        (n_pixels,) model spectrum on the same grid, e.g. line depths of the planet model
+    dv: float
+        Velocity step of one pixel, from log_wavelength_grid
+    max_velocity: float
+        Largest velocity shift to evaluate, in m/s
+    workers: int
+        Number of threads for the FFTs; -1 uses all cores
+
+    Returns
+    -------
+    velocities: array
+        (n_velocities,) velocity of each shift
+    ccf: array
+        (n_exposures, n_velocities). ccf[i, j] = sum over pixels of exposures[i] * template shifted by velocities[j]
+    '''
+    import scipy.fft
+
+    exposures = np.atleast_2d(exposures)
+    n_pix = exposures.shape[-1]
+    max_shift = min(int(np.ceil(max_velocity/dv)), n_pix - 1)
+
+    # zero-padding to at least n + max_shift stops the circular correlation from wrapping around
+    n_fft = scipy.fft.next_fast_len(n_pix + max_shift + 1, real=True)
+    data_ft = scipy.fft.rfft(exposures - exposures.mean(axis=-1, keepdims=True), n=n_fft, workers=workers)
+    template_ft = scipy.fft.rfft(template - template.mean(), n=n_fft, workers=workers)
+    corr = scipy.fft.irfft(data_ft * np.conj(template_ft), n=n_fft, workers=workers)
+
+    shifts = np.arange(-max_shift, max_shift + 1)
+    return shifts*dv, corr[:, shifts % n_fft]
+
+
+def kp_vsys_map(ccf_values, velocities, phases, kp_grid, vsys_grid, kp_chunk=16, n_threads=None):
+    '''
+    Co-add CCFs along planet trajectories v = v_sys + K_p sin(2 pi phase).
+
+    Parameters
+    ----------
+    ccf_values: array
+        (n_exposures, n_velocities) from ccf
+    velocities: array
+        Evenly spaced velocities of the CCF, from ccf
+    phases: array
+        (n_exposures,) orbital phase of each exposure
+    kp_grid, vsys_grid: arrays
+        Trial K_p and systemic velocities, in m/s
+    kp_chunk: int
+        Number of K_p rows evaluated at a time, which bounds the (kp_chunk, n_vsys, n_exposures) temporaries
+    n_threads: int, optional
+        Threads used for the K_p chunks. Defaults to the number of cores.
+
+    Returns
+    -------
+    (n_kp, n_vsys) array. Trajectories that leave the velocity range of the CCF contribute 0 for those exposures.
+    '''
+    kp_grid = np.asarray(kp_grid, dtype=np.float64)
+    vsys_grid = np.asarray(vsys_grid, dtype=np.float64)
+    sin_phase = np.sin(2*np.pi*np.asarray(phases))
+    n_exp, n_vel = ccf_values.shape
+    dv = velocities[1] - velocities[0]
+    exposure = np.arange(n_exp)
+
+    def coadd(kp):
+        v = vsys_grid[None, :, None] + kp[:, None, None]*sin_phase[None, None, :]
+        position = (v - velocities[0])/dv
+        inside = (position >= 0) & (position <= n_vel - 1)
+        left = np.clip(np.floor(position).astype(np.intp), 0, n_vel - 2)
+        weight = position - left
+        values = (1 - weight)*ccf_values[exposure, left] + weight*ccf_values[exposure, left + 1]
+        return np.sum(np.where(inside, values, 0.), axis=-1)
+
+    chunks = [kp_grid[start:start + kp_chunk] for start in range(0, kp_grid.size, kp_chunk)]
+    with ThreadPoolExecutor(max_workers=n_threads or os.cpu_count()) as pool:
+        return np.concatenate(list(pool.map(coadd, chunks)), axis=0)
+
+
+def simulate_exposures(log_grid, star, telluric, planet, phases, kp, vsys, contrast, snr, rng=None):
+    '''
+    Simulated exposures of a planet spectrum moving across a star and telluric spectrum, with photon noise.
+
+    Parameters
+    ----------
+    log_grid: array
+        Log-wavelength grid, from log_wavelength_grid
+    star, telluric, planet: arrays
+        Stellar continuum, telluric transmission and planet spectrum on log_grid. planet is normalized to a
+        continuum of 1; its line depths set the signal.
+    phases: array
+        Orbital phase of each exposure
+    kp, vsys: float
+        Planet orbital and systemic velocity, in m/s
+    contrast: float
+        Planet to star flux ratio in the continuum
+    snr: float
+        S/N per pixel of the star in the continuum, in each exposure
+    rng: np.random.Generator, optional
+
+    Returns
+    -------
+    (n_exposures, n_pixels) array of simulated spectra
+    '''
+    rng = np.random.default_rng(rng)
+    planet_velocities = vsys + kp*np.sin(2*np.pi*np.asarray(phases))
+    shifted = doppler_shift(log_grid, planet, planet_velocities)
+    exposures = telluric[None, :]*star[None, :]*(1 + contrast*shifted)
+    noise_sigma = np.sqrt(exposures/np.max(star))*np.max(star)/snr
+    exposures += rng.standard_normal(exposures.shape)*noise_sigma
+    return exposures
+
+
+def remove_stationary(exposures):
+    '''
+    Divide out the spectrum common to all exposures (star and telluric lines), leaving the moving planet signal.
+    '''
+    return exposures/np.median(exposures, axis=0, keepdims=True) - 1
+
+
+def detection_snr(detection_map, kp_grid, vsys_grid, kp, vsys, exclude=10):
+    '''
+    Peak of a Kp-Vsys map at (kp, vsys), over the standard deviation of the map away from the peak.
+
+    exclude is the half width, in map pixels, of the region around the peak left out of the noise estimate.
+    '''
+    i = np.abs(np.asarray(kp_grid) - kp).argmin()
+    j = np.abs(np.asarray(vsys_grid) - vsys).argmin()
+    mask = np.ones(detection_map.shape, dtype=bool)
+    mask[max(i - exclude, 0):i + exclude + 1, max(j - exclude, 0):j + exclude + 1] = False
+    return (detection_map[i, j] - np.mean(detection_map[mask]))/np.std(detection_map[mask])
@@ -0,0 +1,120 @@
+"""
+Registry of the spectra in data/.
+
+Each entry declares the file, the wavelength unit, whether the file runs long to short wavelength, and how to convert
+the second column to the units used in the scripts. load_dataset returns an (n, 2) array with ascending wavelength in
+um and the converted second column. The normalized copy is saved as a .npy next to the text file, and later loads
+memory-map it instead of parsing the text. The copy is rebuilt when the size or mtime of the text file changes.
+load_datasets loads several entries in parallel on a thread pool.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+
+import numpy as np
+
+from instrumentation import count
+from radiometry import h, c
+from toolkit import cache_path, source_stamp
+
+sr_per_arcsec2 = 1/4.25e10
+
+Dataset = namedtuple('Dataset', ['filename', 'wavelength_scale', 'descending', 'flux_scale', 'to_photons',
+                                 'description'])
+Dataset.__doc__ = '''
+filename: text file, loaded with np.loadtxt
+wavelength_scale: factor converting the file's wavelength column to um
+descending: True if the file runs long to short wavelength
+flux_scale: factor applied to the second column
+to_photons: if True, the second column is also multiplied by wavelength/(h c), converting energy to photons
+description: units after conversion
+'''
+
+registry = {
+    'mk_trans': Dataset('data/mktrans_zm_16_15.dat', 1., False, 1., False,
+                        'Mauna Kea sky transmission'),
+    # ph/sec/arcsec^2/nm/m^2 to ph/sec/arcsec^2/um/m^2. Assumes 273 K
+    'mk_sky_emission': Dataset('data/mk_skybg_zm_16_15_ph.dat', 1., False, 1000., False,
+                               'Mauna Kea sky background, photons/s arcsec^-2 um^-1 m^-2'),
+    # W cm^-2 sr^-1 um^-1 to photons/s arcsec^-2 um^-1 m^-2
+    'oh_emission': Dataset('data/irlinespec1.txt', 1., False, 100**2 * sr_per_arcsec2, True,
+                           'OH line emission, photons/s arcsec^-2 um^-1 m^-2'),
+    'mcmurdo_trans': Dataset('data/transmmsday_40p0km.dat', 1e-3, True, 1., False,
+                             'Sky transmission 40 km above McMurdo'),
+    # uW cm^-2 nm^-1 sr^-1 to photons/s arcsec^-2 um^-1 m^-2
+    'mcmurdo_radiance': Dataset('data/radmmsday_40p0km.dat', 1e-3, True, 1e-6 * 100**2 * 1000 * sr_per_arcsec2, True,
+                                'Sky radiance 40 km above McMurdo, photons/s arcsec^-2 um^-1 m^-2'),
+    'peter_mk_trans': Dataset('data/transmaunanite_4p2km.dat', 1e-3, True, 1., False,
+                              'Mauna Kea sky transmission, 4.2 km model'),
+}
+
+
+def normalize(dataset, data):
+    # flip to ascending wavelength, and convert to um and the registry flux units
+    data = np.array(data[::-1] if dataset.descending else data, dtype=np.float64)
+    data[:, 0] *= dataset.wavelength_scale
+    data[:, 1] *= dataset.flux_scale
+    if dataset.to_photons:
+        data[:, 1] *= data[:, 0]*1e-6/(h*c)  # um to m, then phots/(J m)
+    return data
+
+
+def load_dataset(name, cache=True, cache_dir=None):
+    '''
+    Load a registry entry, normalized to ascending wavelength in um.
+
+    Parameters
+    ----------
+    name: str
+        Key of the registry, e.g. 'mcmurdo_trans'
+    cache: bool
+        Keep a normalized .npy copy, and memory-map it on later loads
+    cache_dir: str, optional
+        Directory of the copy. Defaults to the directory of the text file.
+
+    Returns
+    -------
+    (n, 2) array of wavelength (um) and the converted second column
+    '''
+    dataset = registry[name]
+    if not cache:
+        return normalize(dataset, np.loadtxt(dataset.filename))
+
+    # the conversion is part of the key, so editing a registry entry also rebuilds the copy
+    npy_file = cache_path(dataset.filename, 'normalized', cache_dir=cache_dir)
+    meta_file = npy_file[:-len('.npy')] + '.json'
+    meta = {'source': source_stamp(dataset.filename), 'dataset': dataset._asdict()}
+    try:
+        with open(meta_file) as file:
+            if json.load(file) == meta and os.path.exists(npy_file):
+                count('datasets.cache_hit')
+                return np.load(npy_file, mmap_mode='r')
+    except (OSError, ValueError):
+        pass
+
+    count('datasets.cache_miss')
+    data = normalize(dataset, np.loadtxt(dataset.filename))
+    try:
+        np.save(npy_file + '.tmp.npy', data)
+        os.replace(npy_file + '.tmp.npy', npy_file)
+        with open(meta_file, 'w') as file:
+            json.dump(meta, file)
+    except OSError:
+        pass
+    return data
+
+
+def load_datasets(names=None, cache=True, cache_dir=None, max_workers=None):
+    '''
+    load_dataset for several registry entries at once, on a thread pool.
+
+    Returns
+    -------
+    dict of name to (n, 2) array. Defaults to every entry of the registry.
+    '''
+    names = list(registry) if names is None else list(names)
+    with ThreadPoolExecutor(max_workers=max_workers or max(1, len(names))) as pool:
+        arrays = pool.map(lambda name: load_dataset(name, cache=cache, cache_dir=cache_dir), names)
+        return dict(zip(names, arrays))
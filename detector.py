@@ -0,0 +1,182 @@
+"""
+2D detector frames of the hi-res echelle.
+
+A spectrum is first binned onto the columns of every order (flux-conserving, from its cumulative integral) and
+weighted by the blaze efficiency of the order, then each column is spread over the rows and columns around the order
+trace by a PSF stamp. The stamps depend only on the echelle format and the PSF, so build_frame_model computes them
+once, as flat pixel indices and float32 weights, and every frame after that is one np.bincount. Nothing of size
+n_wavelengths x n_pixels is ever formed.
+
+simulate_frames yields one frame per spectrum of an observing sequence, with photon and read noise, and write_frames
+streams the frames into a memory-mapped .npy, so a whole transit never has to be in memory at once.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from echelle import echelle_format, pixel_to_wavelength, trace_row, blaze_efficiency
+
+FrameModel = namedtuple('FrameModel', ['format', 'column_edges', 'blaze', 'pixel_index', 'weights'])
+FrameModel.__doc__ = '''
+format: EchelleFormat the frames are rendered with
+column_edges: (n_orders, detector_px + 1) wavelength (um) at the edges of every column of every order
+blaze: (n_orders, detector_px) blaze efficiency of every column of every order, at its center wavelength
+pixel_index: (n_orders, detector_px, stamp, stamp) int32 flat detector index of each stamp pixel
+weights: (n_orders, detector_px, stamp, stamp) float32 fraction of the column flux landing on each stamp pixel. Stamp
+pixels that fall off the detector have weight 0.
+'''
+
+
+def build_frame_model(fmt=None, psf_fwhm=2., stamp_half_width=None, blaze='sinc2'):
+    '''
+    Precompute the PSF stamp of every column of every order.
+
+    Parameters
+    ----------
+    fmt: EchelleFormat, optional
+        Defaults to echelle_format(), the hi-res design of spectrograph_calcs.py
+    psf_fwhm: float
+        FWHM of the circular Gaussian PSF, in pixels. The default matches the 2 pixel sampling of the design.
+    stamp_half_width: int, optional
+        The stamps are (2 stamp_half_width + 1) pixels square. Defaults to 3 sigma of the PSF.
+    blaze: str
+        Blaze envelope of the orders, 'sinc2' or 'fsr', see echelle.blaze_efficiency. Neighbouring orders overlap on
+        the detector, and the envelope splits the light of the overlap between them.
+
+    Returns
+    -------
+    FrameModel
+    '''
+    fmt = echelle_format() if fmt is None else fmt
+    n_px = fmt.detector_px
+    sigma = psf_fwhm/(2*np.sqrt(2*np.log(2)))
+    half = int(np.ceil(3*sigma)) if stamp_half_width is None else int(stamp_half_width)
+    offsets = np.arange(-half, half + 1)
+
+    orders = fmt.orders[:, None]
+    columns = np.arange(n_px)
+    column_edges = pixel_to_wavelength(fmt, orders, np.arange(n_px + 1) - 0.5)
+    column_wl = pixel_to_wavelength(fmt, orders, columns)  # (n_orders, n_px)
+    trace_y = trace_row(fmt, column_wl)
+
+    # the trace crosses each column at its center, so only the row profile depends on the column
+    row = np.rint(trace_y).astype(np.int64)[..., None] + offsets  # (n_orders, n_px, stamp)
+    row_profile = np.exp(-0.5*((row - trace_y[..., None])/sigma)**2)
+    column_profile = np.exp(-0.5*(offsets/sigma)**2)
+    col = columns[:, None] + offsets  # (n_px, stamp)
+
+    weights = row_profile[..., :, None]*column_profile
+    weights /= weights.sum(axis=(-2, -1), keepdims=True)
+    on_detector = ((row >= 0) & (row < n_px))[..., :, None] & ((col >= 0) & (col < n_px))[:, None, :]
+    weights = np.where(on_detector, weights, 0.).astype(np.float32)
+    pixel_index = np.where(on_detector, row[..., :, None]*n_px + col[:, None, :], 0).astype(np.int32)
+
+    efficiency = blaze_efficiency(fmt, orders, column_wl, envelope=blaze)
+    return FrameModel(fmt, column_edges, efficiency, pixel_index, weights)
+
+
+def column_flux(model, wavelength, flux):
+    '''
+    Flux of a spectrum collected by every column of every order.
+
+    Parameters
+    ----------
+    model: FrameModel
+    wavelength: array
+        Ascending wavelengths, in um
+    flux: array
+        Spectral flux density at wavelength, per um (e.g. photons/s/um)
+
+    Returns
+    -------
+    (n_orders, detector_px) array of the flux integrated over each column, times the blaze efficiency of the column.
+    Columns outside the spectrum get 0.
+    '''
+    wavelength = np.asarray(wavelength, dtype=np.float64)
+    flux = np.asarray(flux, dtype=np.float64)
+    cumulative = np.concatenate(([0.], np.cumsum(0.5*(flux[1:] + flux[:-1])*np.diff(wavelength))))
+    integral = np.interp(model.column_edges, wavelength, cumulative)
+    return np.abs(np.diff(integral, axis=-1))*model.blaze
+
+
+def render_frame(model, wavelength, flux, out=None):
+    '''
+    Noiseless detector image of a spectrum.
+
+    Parameters
+    ----------
+    model: FrameModel
+    wavelength, flux: arrays
+        As for column_flux
+    out: array, optional
+        (detector_px, detector_px) float32 array to write the frame into
+
+    Returns
+    -------
+    (detector_px, detector_px) float32 frame, in units of flux*um per pixel
+    '''
+    n_px = model.format.detector_px
+    deposits = model.weights*column_flux(model, wavelength, flux)[..., None, None].astype(np.float32)
+    frame = np.bincount(model.pixel_index.ravel(), weights=deposits.ravel(), minlength=n_px*n_px)
+    if out is None:
+        out = np.empty((n_px, n_px), dtype=np.float32)
+    out[...] = frame.reshape(n_px, n_px)
+    return out
+
+
+def simulate_frames(model, wavelength, spectra, exposure_time, background=0., read_noise=0., rng=None):
+    '''
+    Noisy frames of an observing sequence, one per spectrum, generated one at a time.
+
+    Parameters
+    ----------
+    model: FrameModel
+    wavelength: array
+        Ascending wavelengths of the spectra, in um
+    spectra: iterable
+        Spectra on wavelength, in photons/s/um at the detector. May itself be a generator, e.g. of the exposures of a
+        transit.
+    exposure_time: float
+        Seconds
+    background: float, array
+        Photons/s per pixel added to every frame (dark current, thermal background), or a (detector_px, detector_px)
+        map of it
+    read_noise: float
+        Electrons rms per pixel
+    rng: np.random.Generator, optional
+
+    Yields
+    ------
+    (detector_px, detector_px) float32 frames of counts
+    '''
+    rng = np.random.default_rng(rng)
+    n_px = model.format.detector_px
+    for spectrum in spectra:
+        frame = render_frame(model, wavelength, spectrum)
+        frame *= exposure_time
+        frame += np.float32(exposure_time)*np.asarray(background, dtype=np.float32)
+        frame[...] = rng.poisson(frame)
+        if read_noise:
+            frame += np.float32(read_noise)*rng.standard_normal((n_px, n_px), dtype=np.float32)
+        yield frame
+
+
+def write_frames(filename, frames, n_frames, detector_px=2048):
+    '''
+    Stream frames into a memory-mapped (n_frames, detector_px, detector_px) float32 .npy file.
+
+    Stops after n_frames, or when frames runs out, and returns the number of frames written. Unwritten frames are
+    left as 0.
+    '''
+    cube = open_memmap(filename, mode='w+', dtype=np.float32, shape=(n_frames, detector_px, detector_px))
+    n_written = 0
+    for frame in frames:
+        if n_written == n_frames:
+            break
+        cube[n_written] = frame
+        n_written += 1
+    cube.flush()
+    del cube
+    return n_written
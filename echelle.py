@@ -0,0 +1,342 @@
+"""
+Echelle spectrograph design formulas, broadcast over grids of design parameters.
+
+The formulas are the ones in spectrograph_calcs.py, for an immersion echelle used near Littrow with a
+diffraction-limited slit. Angles are in radians, lengths in m unless the name says otherwise, and grating densities in
+lines/mm.
+
+echelle_format precomputes where the orders of one design land on the detector. wavelength_to_pixel and
+pixel_to_wavelength map between wavelength (um) and (order, column, row) in closed form, for any number of
+wavelengths at once.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+n_si = 3.435  # index of refraction of Si at 130 Kelvin, longward of 1 um
+
+design_parameters = ('theta', 'delta', 'R', 'D', 'F', 'px_pitch', 'grating_density')
+
+
+def evaluate_designs(theta, delta, R, D, F, px_pitch, grating_density, wl_band=(1.47e-6, 2.5e-6), wl_crit=1.5e-6,
+                     n_grating=n_si, px_sampling=2, detector_px=2048, order_spacing_px=30):
+    '''
+    Derived quantities of echelle designs. All parameters broadcast against each other.
+
+    Parameters
+    ----------
+    theta: float, array
+        Off-blaze angle
+    delta: float, array
+        Blaze angle
+    R: float, array
+        Resolving power
+    D: float, array
+        Telescope diameter
+    F: float, array
+        F-number of the collimator
+    px_pitch: float, array
+        Detector pixel pitch
+    grating_density: float, array
+        Grating lines/mm
+    wl_band: tuple
+        Shortest and longest wavelength to cover, in m
+    wl_crit: float
+        Wavelength the slit is diffraction-limited at, in m
+    n_grating: float
+        Index of refraction of the immersion grating
+    px_sampling: float
+        Pixels per slit width on the detector
+    detector_px: int
+        Width and height of the detector, in pixels
+    order_spacing_px: float
+        Detector rows used by each order, including the gap to the next order
+
+    Returns
+    -------
+    dict of arrays:
+        d1: collimated beam diameter, mm
+        f1: collimator focal length, mm
+        f2: camera focal length, mm
+        slit_width: um
+        slit_angle: slit sky angle, arcseconds
+        fold_clearance: f1 fold mirror clearance, mm
+        m_min, m_max, n_orders: orders needed to cover wl_band
+        order_length_px: length of the longest order on the detector
+        format_height_px: detector rows used by all orders
+        fits_detector: True if every order fits in the width, and all orders fit in the height, of the detector
+    '''
+    alpha = delta + theta
+    beta_b = delta - theta
+    sigma = 1e-3/grating_density  # groove spacing, m
+
+    d1 = R * wl_crit/2 * np.cos(alpha) / (np.sin(delta) * np.cos(theta)) * 1e3  # convert to mm
+    f2 = d1/wl_crit * px_sampling*px_pitch
+    f1 = d1 * F
+    slit_width = 2*wl_crit*F*1e6  # convert m to um
+    slit_angle = np.degrees(2*wl_crit/D)*3600  # set slit sky angle to diffract limit at wl_crit
+    fold_clearance = 2 * F * d1 * theta  # small angle approximation
+
+    # blaze wavelength of order m is 2 sigma n sin(delta) cos(theta)/m
+    blaze_m = 2*sigma*n_grating*np.sin(delta)*np.cos(theta)
+    m_max = np.floor(blaze_m/wl_band[0])
+    m_min = np.ceil(blaze_m/wl_band[1])
+    n_orders = m_max - m_min + 1
+
+    # one free spectral range, lambda_b/m, spans an angle of lambda_b/(n sigma cos(beta)); longest for the lowest order
+    order_length_px = f2*1e-3 * blaze_m/m_min / (n_grating*sigma*np.cos(beta_b)) / px_pitch
+    format_height_px = n_orders*order_spacing_px
+    fits_detector = (order_length_px <= detector_px) & (format_height_px <= detector_px)
+
+    return {'d1': d1, 'f1': f1, 'f2': f2, 'slit_width': slit_width, 'slit_angle': slit_angle,
+            'fold_clearance': fold_clearance, 'm_min': m_min, 'm_max': m_max, 'n_orders': n_orders,
+            'order_length_px': order_length_px, 'format_height_px': format_height_px, 'fits_detector': fits_detector}
+
+
+def pareto_mask(objectives):
+    '''
+    Mask of the rows of objectives that no other row dominates. Every column is minimized.
+
+    A row dominates another if it is no worse in every column and better in at least one. Rows with identical
+    objectives are all kept, or all dropped.
+    '''
+    objectives = np.asarray(objectives, dtype=np.float64)
+    # many designs share the same objectives, so the front is found among the distinct rows only
+    unique, inverse = np.unique(objectives, axis=0, return_inverse=True)
+
+    # sweep through the rows, each time dropping every row the current one dominates
+    candidates = np.arange(unique.shape[0])
+    current = 0
+    while current < candidates.size:
+        point = unique[candidates[current]]
+        survivors = np.any(unique[candidates] < point, axis=1)
+        survivors[current] = True
+        candidates = candidates[survivors]
+        current = np.count_nonzero(survivors[:current]) + 1
+
+    efficient = np.zeros(unique.shape[0], dtype=bool)
+    efficient[candidates] = True
+    return efficient[inverse.ravel()]
+
+
+def design_sweep(theta, delta, R, D, F, px_pitch, grating_density, objectives=(('d1', 'min'), ('R', 'max')),
+                 min_fold_clearance=0., chunk_size=2**20, **kwargs):
+    '''
+    Evaluate every combination of the given design parameters, and return the feasible Pareto-optimal designs.
+
+    The combinations are never all held in memory: they are evaluated chunk_size at a time, and only the running
+    Pareto front is kept between chunks.
+
+    Parameters
+    ----------
+    theta, delta, R, D, F, px_pitch, grating_density: float or 1D arrays
+        Values to sweep, see evaluate_designs
+    objectives: tuple
+        (name, 'min' or 'max') pairs. name is a design parameter or a key of the evaluate_designs result.
+    min_fold_clearance: float
+        Smallest acceptable f1 fold mirror clearance, mm
+    chunk_size: int
+        Number of combinations evaluated at a time
+    kwargs:
+        Passed to evaluate_designs, e.g. detector_px, order_spacing_px, wl_band
+
+    Returns
+    -------
+    front: structured array
+        One record per Pareto-optimal design, with fields for every design parameter and every derived quantity
+    n_feasible: int
+        Number of combinations that met the constraints
+    '''
+    axes = [np.atleast_1d(np.asarray(value, dtype=np.float64)) for value in
+            (theta, delta, R, D, F, px_pitch, grating_density)]
+    shape = tuple(axis.size for axis in axes)
+    total = int(np.prod(shape))
+
+    front = None
+    n_feasible = 0
+    for start in range(0, total, chunk_size):
+        flat = np.arange(start, min(start + chunk_size, total))
+        params = dict(zip(design_parameters, (axis[index] for axis, index in zip(axes, np.unravel_index(flat, shape)))))
+        derived = evaluate_designs(**params, **kwargs)
+
+        feasible = derived['fits_detector'] & (derived['fold_clearance'] >= min_fold_clearance)
+        n_feasible += int(np.count_nonzero(feasible))
+        if not np.any(feasible):
+            continue
+
+        columns = {**params, **derived}
+        chunk = np.empty(np.count_nonzero(feasible), dtype=[(name, np.asarray(value).dtype) for name, value in
+                                                             columns.items()])
+        for name, value in columns.items():
+            chunk[name] = value[feasible]
+
+        front = chunk if front is None else np.concatenate((front, chunk))
+        # sign flips turn every objective into one to minimize
+        score = np.column_stack([front[name] * (1 if sense == 'min' else -1) for name, sense in objectives])
+        front = front[pareto_mask(score)]
+
+    if front is None:
+        columns = {**dict.fromkeys(design_parameters, 1.), **evaluate_designs(*[1.]*7, **kwargs)}
+        front = np.empty(0, dtype=[(name, np.asarray(value).dtype) for name, value in columns.items()])
+    return front, n_feasible
+
+
+EchelleFormat = namedtuple('EchelleFormat', ['orders', 'blaze', 'wl_start', 'wl_end', 'x_start', 'x_end', 'y_blaze',
+                                             'dispersion', 'alpha', 'beta_blaze', 'n_sigma', 'f_camera', 'px_pitch',
+                                             'detector_px', 'cross_dispersion', 'wl_ref'])
+EchelleFormat.__doc__ = '''
+Precomputed echelle format. Wavelengths are in um, positions in pixels, and all per-order fields are arrays aligned
+with orders.
+
+orders: echelle orders, ascending
+blaze: blaze wavelength of each order
+wl_start, wl_end: free spectral range of each order
+x_start, x_end: columns of the free spectral range ends, which may be off the detector
+y_blaze: row of each blaze wavelength
+dispersion: um per pixel at the blaze wavelength
+'''
+
+
+def echelle_format(orders=np.arange(72, 122+1), delta=np.radians(71.56), theta=np.radians(1.6), grating_density=36.5,
+                   n_grating=n_si, f_camera=219.96, px_pitch=18e-6, detector_px=2048, cross_dispersion=None):
+    '''
+    Precompute where each order of the echelle lands on the detector.
+
+    Along an order, the columns follow the grating equation m lambda = n sigma (sin(alpha) + sin(beta)), with the blaze
+    direction at the center column. Across orders, the cross disperser is modelled as linear in wavelength, so row
+    increases with wavelength, and the orders are spaced by the free spectral range.
+
+    Parameters
+    ----------
+    orders: array
+        Echelle orders, the hires_orders of spectrograph_calcs.py by default
+    delta, theta: float
+        Blaze and off-blaze angles, radians
+    grating_density: float
+        Lines/mm
+    n_grating: float
+        Index of refraction of the immersion grating
+    f_camera: float
+        Camera focal length, mm
+    px_pitch: float
+        Pixel pitch, m
+    detector_px: int
+        Width and height of the detector, pixels
+    cross_dispersion: float, optional
+        Rows per um. Defaults to spreading the blaze wavelengths of all orders over 90% of the detector height.
+
+    Returns
+    -------
+    EchelleFormat
+    '''
+    orders = np.asarray(orders)
+    alpha = delta + theta
+    beta_blaze = delta - theta
+    n_sigma = n_grating * 1e3/grating_density  # n times the groove spacing, um
+
+    blaze = n_sigma*(np.sin(alpha) + np.sin(beta_blaze))/orders
+    # order m holds the wavelengths whose blaze order number, m blaze/lambda, rounds to m, as in wavelength_to_pixel;
+    # the ranges of neighbouring orders meet without gaps or overlaps
+    wl_start = blaze*orders/(orders + 0.5)
+    wl_end = blaze*orders/(orders - 0.5)
+    if cross_dispersion is None:
+        cross_dispersion = 0.9*detector_px/(blaze.max() - blaze.min())
+    wl_ref = 0.5*(blaze.max() + blaze.min())
+
+    fmt = EchelleFormat(orders, blaze, wl_start, wl_end, None, None, None, None, alpha, beta_blaze, n_sigma,
+                        f_camera, px_pitch, detector_px, cross_dispersion, wl_ref)
+    x_start = _column(fmt, orders, wl_start)
+    x_end = _column(fmt, orders, wl_end)
+    y_blaze = trace_row(fmt, blaze)
+    # d lambda/d x = n sigma cos(beta) / m * px_pitch/f_camera
+    dispersion = n_sigma*np.cos(beta_blaze)/orders * px_pitch/(f_camera*1e-3)
+
+    return fmt._replace(x_start=x_start, x_end=x_end, y_blaze=y_blaze, dispersion=dispersion)
+
+
+def _column(fmt, order, wavelength):
+    sin_beta = order*wavelength/fmt.n_sigma - np.sin(fmt.alpha)
+    with np.errstate(invalid='ignore'):
+        beta = np.arcsin(sin_beta)
+    return 0.5*fmt.detector_px + fmt.f_camera*1e-3*np.tan(beta - fmt.beta_blaze)/fmt.px_pitch
+
+
+def trace_row(fmt, wavelength):
+    '''
+    Row (pixels) of the order trace at wavelength (um). It is the same in every order, since the cross disperser is
+    linear in wavelength.
+    '''
+    return 0.5*fmt.detector_px + (wavelength - fmt.wl_ref)*fmt.cross_dispersion
+
+
+def blaze_efficiency(fmt, order, wavelength, envelope='sinc2'):
+    '''
+    Fraction of the light at wavelength (um) diffracted into order. order and wavelength broadcast against each other.
+
+    'sinc2' is the blaze function of a grating with the blaze direction at the center of each order,
+    sinc^2(m (1 - lambda_b/lambda)); 'fsr' keeps each wavelength in the one order whose free spectral range holds it.
+    Either way the efficiencies of all orders sum to 1 at every wavelength, so a wavelength seen in two orders is not
+    counted twice.
+    '''
+    wavelength = np.asarray(wavelength, dtype=np.float64)
+    # m lambda_b is the same for every order
+    blaze_order = fmt.n_sigma*(np.sin(fmt.alpha) + np.sin(fmt.beta_blaze))/wavelength
+    if envelope == 'sinc2':
+        return np.sinc(np.asarray(order) - blaze_order)**2
+    elif envelope == 'fsr':
+        return (np.rint(blaze_order) == order).astype(np.float64)
+    raise ValueError(f'unknown blaze envelope {envelope}, use sinc2 or fsr')
+
+
+def wavelength_to_pixel(fmt, wavelength):
+    '''
+    Detector position of each wavelength, in the order whose free spectral range contains it.
+
+    Parameters
+    ----------
+    fmt: EchelleFormat
+    wavelength: array
+        Wavelengths in um, any shape
+
+    Returns
+    -------
+    order, x, y: arrays
+        Same shape as wavelength. Wavelengths outside every order, or off the detector, get order -1 and NaN
+        positions.
+    '''
+    wavelength = np.asarray(wavelength, dtype=np.float64)
+    # the blaze order number is n sigma (sin(alpha) + sin(beta_b))/lambda; its nearest integer is the order whose
+    # free spectral range holds lambda
+    order = np.rint(fmt.n_sigma*(np.sin(fmt.alpha) + np.sin(fmt.beta_blaze))/wavelength).astype(np.int64)
+    x = _column(fmt, order, wavelength)
+    y = trace_row(fmt, wavelength)
+
+    valid = np.isin(order, fmt.orders)
+    valid &= (x >= 0) & (x <= fmt.detector_px - 1) & (y >= 0) & (y <= fmt.detector_px - 1)
+    return np.where(valid, order, -1), np.where(valid, x, np.nan), np.where(valid, y, np.nan)
+
+
+def pixel_to_wavelength(fmt, order, x):
+    '''
+    Wavelength (um) at column x of an order. order and x broadcast against each other.
+
+    The row is not needed, since the cross disperser is only used to separate the orders.
+    '''
+    beta = fmt.beta_blaze + np.arctan((np.asarray(x, dtype=np.float64) - 0.5*fmt.detector_px)*fmt.px_pitch
+                                      / (fmt.f_camera*1e-3))
+    return fmt.n_sigma*(np.sin(fmt.alpha) + np.sin(beta))/np.asarray(order)
+
+
+def order_trace(fmt, order=None):
+    '''
+    Dispersion solution of each order on the detector columns.
+
+    Returns
+    -------
+    wavelength, y: arrays
+        (n_orders, detector_px) wavelength and row of every column of every order (or of the given orders)
+    '''
+    order = fmt.orders if order is None else np.atleast_1d(order)
+    wavelength = pixel_to_wavelength(fmt, order[:, None], np.arange(fmt.detector_px)[None, :])
+    return wavelength, trace_row(fmt, wavelength)
@@ -0,0 +1,112 @@
+"""
+Monte Carlo check of the cross-correlation S/N scaling of snr_calculator.
+
+spectrum_calcs.txt argues that correlating a line template T with the planet signal contrast*(1-T) plus photon noise
+gives SNR_cc = SNR * contrast * [Sum (1-T)^2]^(1/2), with SNR the S/N per pixel of the star over the whole
+observation. injection_recovery tests that directly: it injects contrast*(1-T) into many photon-noise realizations,
+cross-correlates each with the template, and compares the recovered S/N with the analytic one. cross_correlation.ccf
+subtracts the mean of the data and the template, so the analytic value uses the line depths about their mean.
+
+Each worker of the process pool gets the signal and a noise buffer once, from the pool initializer. The noise of
+each batch of realizations is drawn into that buffer, the signal is added in place, and all realizations of the batch
+are cross-correlated with one batched FFT. Every batch has its own random stream, so the result depends on seed but
+not on the number of workers.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import numpy as np
+
+from cross_correlation import ccf
+from toolkit import snr_calculator
+
+InjectionResult = namedtuple('InjectionResult', ['peak', 'detection_snr', 'empirical_snr', 'analytic_snr',
+                                                 'n_lines'])
+InjectionResult.__doc__ = '''
+peak: (n_realizations,) cross-correlation at the injected (zero) lag
+detection_snr: (n_realizations,) peak over the scatter of the cross-correlation away from the peak, the S/N an
+    observer would quote for each realization. Sidelobes of the template autocorrelation add to the scatter, so this
+    sits somewhat below the matched-filter value for templates with regularly spaced lines.
+empirical_snr: mean over standard deviation of peak, the matched-filter S/N of the simulation
+analytic_snr: snr_calculator with n_lines
+n_lines: Sum (d - mean(d))^2 over the template, with d = 1-T the line depth
+'''
+
+# signal, template, noise buffer and ccf settings of this worker process, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(signal, template, sigma, batch_size, max_lag, exclude):
+    _worker.update(signal=signal, template=template, sigma=sigma, buffer=np.empty((batch_size, signal.size)),
+                   max_lag=max_lag, off_peak=np.abs(np.arange(-max_lag, max_lag + 1)) > exclude)
+
+
+def _recover_batch(n, seed):
+    # noise into the worker's buffer, then one batched CCF
+    data = _worker['buffer'][:n]
+    np.random.default_rng(seed).standard_normal(out=data)
+    data *= _worker['sigma']
+    data += _worker['signal']
+    max_lag = _worker['max_lag']
+    _, values = ccf(data, _worker['template'], 1., max_lag, workers=1)
+    noise = values[:, _worker['off_peak']]
+    return values[:, max_lag], (values[:, max_lag] - noise.mean(axis=1))/noise.std(axis=1)
+
+
+def injection_recovery(transmission, snr_ref, exposure_time, contrast, r_new=1., r_ref=1., t_ref=120,
+                       n_realizations=2000, max_lag=200, exclude=5, batch_size=256, max_workers=None, seed=None):
+    '''
+    Inject a planet signal into photon-noise realizations and recover it by cross-correlation.
+
+    Parameters
+    ----------
+    transmission: array
+        Line template T on its own pixel grid, e.g. the smoothed Mauna Kea transmission between 1.56 and 1.62 um.
+        The planet signal is contrast*(1-T) in units of the stellar continuum.
+    snr_ref, exposure_time, contrast, r_new, r_ref, t_ref:
+        As for toolkit.snr_calculator. The per-pixel noise of the co-added observation is
+        1/(snr_ref * sqrt(exposure_time/t_ref) * r_new/r_ref) of the continuum.
+    n_realizations: int
+        Number of noise realizations
+    max_lag: int
+        Largest pixel lag of the cross-correlation
+    exclude: int
+        Lags within exclude pixels of 0 are left out of the scatter for detection_snr
+    batch_size: int
+        Realizations cross-correlated at a time, which bounds the memory of each worker
+    max_workers: int, optional
+        Processes of the pool. Defaults to the number of cores; 1 runs in this process.
+    seed: int, optional
+        Seed of the random streams
+
+    Returns
+    -------
+    InjectionResult
+    '''
+    depth = 1 - np.asarray(transmission, dtype=np.float64)
+    n_lines = np.sum((depth - depth.mean())**2)
+    analytic = snr_calculator(snr_ref, exposure_time, r_new, contrast, n_lines, r_ref, t_ref)
+    sigma = 1/(snr_ref*np.sqrt(exposure_time/t_ref)*r_new/r_ref)
+    signal = contrast*depth
+    max_lag = min(max_lag, depth.size - 1)
+
+    # one batch per task, so the split is the same for any number of workers
+    n_tasks = -(-n_realizations//batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(n_tasks)
+    sizes = [min(batch_size, n_realizations - i*batch_size) for i in range(n_tasks)]
+    worker_args = (signal, depth, sigma, min(batch_size, n_realizations), max_lag, exclude)
+    if max_workers == 1:
+        _init_worker(*worker_args)
+        results = [_recover_batch(size, task_seed) for size, task_seed in zip(sizes, seeds)]
+        _worker.clear()
+    else:
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_worker,
+                                 initargs=worker_args) as pool:
+            results = list(pool.map(_recover_batch, sizes, seeds))
+
+    peak = np.concatenate([result[0] for result in results])
+    detection = np.concatenate([result[1] for result in results])
+    return InjectionResult(peak, detection, peak.mean()/peak.std(), analytic, n_lines)
@@ -0,0 +1,190 @@
+"""
+Stage timers, counters and optional memory tracking and profiling for the scripts.
+
+Scripts mark their stages with
+
+    with stage('smoothing'):
+        ...
+
+and library functions count events with count('name'). Nothing is recorded until enable() is called, and until then
+stage() hands back one shared do-nothing context manager and count() returns straight away, so the calls can stay in
+place permanently. Once enabled, every stage records its number of calls and total wall time, and, with
+memory=True, the peak memory traced by tracemalloc while it ran (which slows the traced code down noticeably).
+profile=True also runs cProfile over everything after enable(). At exit a per-stage summary is printed, and written
+as JSON if json_file is given.
+
+enable_from_env() reads the same options from the environment, so a script can be profiled without editing it:
+
+    BALLOON_PROFILE=1 BALLOON_PROFILE_MEMORY=1 BALLOON_PROFILE_JSON=stages.json python signal_noise_calcs.py
+    BALLOON_PROFILE_CPROFILE=run.prof python instrument_plots.py
+"""
+
+import atexit
+import contextlib
+import json
+import os
+import time
+import tracemalloc
+
+_enabled = False
+_memory = False
+_profiler = None
+_profile_file = None
+_json_file = None
+_stages = {}
+_counters = {}
+# one [current memory at entry, highest peak seen so far] frame per open stage, when tracking memory
+_memory_stack = []
+_null_stage = contextlib.nullcontext()
+
+
+def enable(memory=False, profile=False, profile_file=None, json_file=None, report=True):
+    '''
+    Start recording stages and counters.
+
+    Parameters
+    ----------
+    memory: bool
+        Track the peak memory of each stage with tracemalloc
+    profile: bool
+        Run cProfile until exit. The 25 most expensive functions are printed in the report.
+    profile_file: str, optional
+        Also dump the cProfile statistics to this file, for pstats or snakeviz. Implies profile.
+    json_file: str, optional
+        Write the report to this file as JSON at exit
+    report: bool
+        Print the summary at exit
+    '''
+    global _enabled, _memory, _profiler, _profile_file, _json_file
+    if _enabled:
+        return
+    _enabled = True
+    _memory = memory
+    _json_file = json_file
+    _profile_file = profile_file
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if profile or profile_file:
+        import cProfile
+
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    atexit.register(_at_exit, report)
+
+
+def enable_from_env():
+    '''
+    enable() if BALLOON_PROFILE, BALLOON_PROFILE_CPROFILE or BALLOON_PROFILE_JSON is set.
+
+    BALLOON_PROFILE_MEMORY=1 turns on memory tracking, BALLOON_PROFILE_CPROFILE=<file> turns on cProfile and dumps
+    the statistics to the file, and BALLOON_PROFILE_JSON=<file> writes the report as JSON.
+    '''
+    profile_file = os.environ.get('BALLOON_PROFILE_CPROFILE') or None
+    json_file = os.environ.get('BALLOON_PROFILE_JSON') or None
+    if os.environ.get('BALLOON_PROFILE', '0') not in ('', '0') or profile_file or json_file:
+        enable(memory=os.environ.get('BALLOON_PROFILE_MEMORY', '0') not in ('', '0'), profile_file=profile_file,
+               json_file=json_file)
+
+
+def is_enabled():
+    return _enabled
+
+
+@contextlib.contextmanager
+def _timed_stage(name):
+    if _memory:
+        _, peak = tracemalloc.get_traced_memory()
+        if _memory_stack:
+            _memory_stack[-1][1] = max(_memory_stack[-1][1], peak)
+        tracemalloc.reset_peak()
+        _memory_stack.append([tracemalloc.get_traced_memory()[0], 0])
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        record = _stages.setdefault(name, {'calls': 0, 'seconds': 0.})
+        record['calls'] += 1
+        record['seconds'] += elapsed
+        if _memory:
+            entry, highest = _memory_stack.pop()
+            highest = max(highest, tracemalloc.get_traced_memory()[1])
+            record['peak_mb'] = max(record.get('peak_mb', 0.), (highest - entry)/2**20)
+            if _memory_stack:
+                _memory_stack[-1][1] = max(_memory_stack[-1][1], highest)
+
+
+def stage(name):
+    '''
+    Context manager timing a named stage. Repeated stages of the same name are accumulated.
+    '''
+    return _timed_stage(name) if _enabled else _null_stage
+
+
+def timed(name=None):
+    '''
+    Decorator running a function as a stage, named after the function by default.
+    '''
+    def decorator(func):
+        stage_name = name or func.__qualname__
+
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _timed_stage(stage_name):
+                return func(*args, **kwargs)
+
+        wrapper.__name__ = func.__name__
+        wrapper.__qualname__ = func.__qualname__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+    return decorator
+
+
+def count(name, n=1):
+    '''
+    Add n to a named counter, e.g. cache hits.
+    '''
+    if _enabled:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def report():
+    '''
+    The recorded stages and counters, as a dict.
+    '''
+    return {'stages': {name: dict(record) for name, record in _stages.items()}, 'counters': dict(_counters)}
+
+
+def format_report(result=None):
+    '''
+    Per-stage summary table of report(), slowest stage first.
+    '''
+    result = report() if result is None else result
+    lines = [f'{"stage":<32} {"calls":>7} {"total s":>10} {"mean ms":>10} {"peak MB":>9}']
+    for name, record in sorted(result['stages'].items(), key=lambda item: -item[1]['seconds']):
+        peak = f'{record["peak_mb"]:9.1f}' if 'peak_mb' in record else f'{"":>9}'
+        lines.append(f'{name:<32} {record["calls"]:>7} {record["seconds"]:>10.3f} '
+                     f'{record["seconds"]/record["calls"]*1e3:>10.2f} {peak}')
+    for name, value in sorted(result['counters'].items()):
+        lines.append(f'{name:<32} {value:>7}')
+    return '\n'.join(lines)
+
+
+def _at_exit(print_report):
+    if _profiler is not None:
+        _profiler.disable()
+    result = report()
+    if print_report:
+        print(format_report(result))
+    if _json_file:
+        with open(_json_file, 'w') as file:
+            json.dump(result, file, indent=1)
+    if _profiler is not None:
+        import pstats
+
+        if _profile_file:
+            _profiler.dump_stats(_profile_file)
+        if print_report:
+            pstats.Stats(_profiler).sort_stats('cumulative').print_stats(25)
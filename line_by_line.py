@@ -0,0 +1,267 @@
+"""
+Absorption cross sections computed line by line from a line list.
+
+Each line (HITRAN conventions: position and intensity at T_ref = 296 K, lower state energy, air broadening and its
+temperature exponent, pressure shift) is scaled to the temperature, broadened to a Voigt profile (scipy's
+voigt_profile, imported when needed) and summed onto a wavenumber grid. Lines are cut off beyond cutoff cm^-1 from
+their center, and only the grid points inside the cutoff are evaluated, in chunks of at most max_pairs (line, grid
+point) pairs. The grid is split into blocks that run on a process pool; each block only sees the lines within the
+cutoff of it. The workers memory-map the line list from a file written by save_line_list and slice their block out of
+it, so a task is only a file name and two indices however long the line list is.
+
+cross_section returns (wavenumber, cross section) like toolkit.open_cross_section, so it can stand in for the
+precomputed line_lists files, and line_by_line_loader plugs it into opacity_grid.build_opacity_grid. Wavenumbers are in
+cm^-1, cross sections in cm^2/molecule, pressures in bars and temperatures in K.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+
+c2 = 1.4387769  # second radiation constant hc/k, cm K
+k_B = 1.380649e-23  # J/K
+amu_kg = 1.66053907e-27  # kg/amu
+c = 299792458.  # m/s
+T_ref = 296.  # K, reference temperature of HITRAN intensities and widths
+atm_per_bar = 1/1.01325
+
+LineList = namedtuple('LineList', ['wavenumber', 'intensity', 'lower_energy', 'gamma_air', 'n_air', 'delta_air'])
+LineList.__doc__ = '''
+Line parameters, one array entry per line, sorted by wavenumber.
+
+wavenumber: line position, cm^-1
+intensity: line intensity at T_ref, cm^-1/(molecule cm^-2)
+lower_energy: lower state energy, cm^-1
+gamma_air: air-broadened Lorentz half width at T_ref and 1 atm, cm^-1/atm
+n_air: temperature exponent of gamma_air
+delta_air: pressure shift at 1 atm, cm^-1/atm
+'''
+
+# HITRAN 2004+ .par fixed-width fields up to delta_air; the rest of each 160 character record is not used
+_par_fields = [('molecule', 'S2'), ('isotope', 'S1'), ('wavenumber', 'S12'), ('intensity', 'S10'),
+               ('einstein_a', 'S10'), ('gamma_air', 'S5'), ('gamma_self', 'S5'), ('lower_energy', 'S10'),
+               ('n_air', 'S4'), ('delta_air', 'S8')]
+_par_width = sum(int(code[1:]) for _, code in _par_fields)
+
+
+def _parse_par_records(block, dtype, wn_range):
+    # fixed-width records to LineList columns, without splitting lines in Python
+    records = np.frombuffer(block, dtype=dtype)
+    wavenumber = records['wavenumber'].astype(np.float64)
+    keep = slice(None) if wn_range is None else (wavenumber >= wn_range[0]) & (wavenumber < wn_range[1])
+    return [wavenumber[keep]] + [records[field][keep].astype(np.float64) for field in LineList._fields[1:]]
+
+
+def read_hitran_par(filename, wn_range=None, chunk_records=2**20):
+    '''
+    Read a HITRAN .par line list (160 character records).
+
+    The file is read in blocks of chunk_records records, and each block is cut into its fixed-width fields with one
+    np.frombuffer, so only the six columns of the lines inside wn_range are ever held in memory.
+
+    Parameters
+    ----------
+    filename: str
+    wn_range: tuple, optional
+        (wn_start, wn_end) of the lines to keep
+    chunk_records: int
+        Records per block
+
+    Returns
+    -------
+    LineList
+    '''
+    with open(filename, 'rb') as file:
+        # every record has the length of the first, including its line ending (\n or \r\n)
+        record_length = len(file.readline())
+        file.seek(0)
+        if record_length < _par_width:
+            raise ValueError(f'{filename} does not have HITRAN .par records')
+        dtype = np.dtype(_par_fields + [('rest', f'S{record_length - _par_width}')])
+
+        blocks = []
+        while True:
+            block = file.read(chunk_records*record_length)
+            if len(block) < chunk_records*record_length:
+                # trailing blank lines at the end of the file
+                block = block.rstrip()
+            if not block:
+                break
+            if len(block) % record_length:
+                # the last record has no line ending
+                block = block.ljust(len(block) + record_length - len(block) % record_length)
+            blocks.append(_parse_par_records(block, dtype, wn_range))
+
+    columns = [np.concatenate(column) for column in zip(*blocks)] if blocks else [np.empty(0)]*len(LineList._fields)
+    order = np.argsort(columns[0], kind='stable')
+    return LineList(*(np.ascontiguousarray(column[order]) for column in columns))
+
+
+def save_line_list(filename, lines):
+    # one structured .npy, so open_line_list can memory-map it
+    table = np.empty(lines.wavenumber.size, dtype=[(field, np.float64) for field in LineList._fields])
+    for field in LineList._fields:
+        table[field] = getattr(lines, field)
+    np.save(filename, table)
+
+
+def open_line_list(filename):
+    '''
+    Memory-map a line list written by save_line_list. Nothing is read until the lines are used.
+    '''
+    table = np.load(filename, mmap_mode='r')
+    return LineList(*(table[field] for field in LineList._fields))
+
+
+def line_strengths(lines, temperature, partition_ratio):
+    '''
+    Line intensities at temperature, in cm^-1/(molecule cm^-2).
+
+    partition_ratio is Q(T_ref)/Q(temperature) of the species.
+    '''
+    return lines.intensity * partition_ratio \
+        * np.exp(-c2*lines.lower_energy*(1/temperature - 1/T_ref)) \
+        * -np.expm1(-c2*lines.wavenumber/temperature) / -np.expm1(-c2*lines.wavenumber/T_ref)
+
+
+def _block_cross_section(lines, grid, temperature, pressure, mass, partition_ratio, cutoff, max_pairs,
+                         min_intensity):
+    # the cross section of one wavenumber block, from the lines within cutoff of it
+    from scipy.special import voigt_profile
+
+    p_atm = pressure*atm_per_bar
+    strength = line_strengths(lines, temperature, partition_ratio)
+    center = lines.wavenumber + lines.delta_air*p_atm
+    gamma = lines.gamma_air*p_atm*(T_ref/temperature)**lines.n_air
+    sigma_doppler = center/c*np.sqrt(k_B*temperature/(mass*amu_kg))
+    if min_intensity > 0:
+        keep = strength > min_intensity
+        strength, center, gamma, sigma_doppler = strength[keep], center[keep], gamma[keep], sigma_doppler[keep]
+
+    n_grid = grid.size
+    first = np.searchsorted(grid, center - cutoff, side='left')
+    n_pairs = np.searchsorted(grid, center + cutoff, side='right') - first
+
+    result = np.zeros(n_grid)
+    pair_end = np.cumsum(n_pairs)
+    start = 0
+    while start < center.size:
+        # as many lines as fit in max_pairs pairs, and at least one
+        limit = (pair_end[start - 1] if start else 0) + max_pairs
+        stop = max(int(np.searchsorted(pair_end, limit, side='right')), start + 1)
+        counts = n_pairs[start:stop]
+        line = np.repeat(np.arange(start, stop), counts)
+        point = np.repeat(first[start:stop], counts) + np.arange(counts.sum()) - \
+            np.repeat(np.cumsum(counts) - counts, counts)
+        profile = voigt_profile(grid[point] - center[line], sigma_doppler[line], gamma[line])
+        result += np.bincount(point, weights=strength[line]*profile, minlength=n_grid)
+        start = stop
+    return result
+
+
+def _file_block_cross_section(line_file, first, last, grid, *args):
+    # a pool task: the lines of one block, memory-mapped from the line list file
+    lines = open_line_list(line_file)
+    return _block_cross_section(LineList(*(np.asarray(field[first:last]) for field in lines)), grid, *args)
+
+
+def cross_section(lines, wavenumber, temperature, pressure, mass, partition_function=None, cutoff=25.,
+                  max_pairs=2**22, min_intensity=0., n_blocks=None, max_workers=None):
+    '''
+    Absorption cross section of a line list on a wavenumber grid.
+
+    Parameters
+    ----------
+    lines: LineList or str
+        Sorted by wavenumber, e.g. from read_hitran_par or open_line_list, or the name of a file written by
+        save_line_list. With a pool, the workers read their lines from the file; a LineList is first written to a
+        temporary file, so passing the file name saves that copy.
+    wavenumber: array
+        Ascending grid, cm^-1
+    temperature: float
+        K
+    pressure: float
+        Total pressure, bars. The lines are broadened with their air-broadening parameters.
+    mass: float
+        Molecular mass, amu (18 for H2O)
+    partition_function: callable, optional
+        Q(T) of the species, e.g. from the HITRAN TIPS tables. Defaults to Q proportional to T^1.5, the
+        high-temperature limit for a nonlinear molecule, which is only a rough approximation for H2O at 1500 K.
+    cutoff: float
+        Line wing cutoff, cm^-1 from the line center
+    max_pairs: int
+        Largest number of (line, grid point) pairs evaluated at a time in each worker, which bounds its memory
+    min_intensity: float
+        Lines weaker than this at temperature are skipped
+    n_blocks: int, optional
+        Number of wavenumber blocks. Defaults to four per worker.
+    max_workers: int, optional
+        Processes of the pool. Defaults to the number of cores; 1 runs in this process.
+
+    Returns
+    -------
+    wavenumber, cross_section: arrays
+        The grid and the cross section on it, in cm^2/molecule
+    '''
+    wavenumber = np.asarray(wavenumber, dtype=np.float64)
+    if partition_function is None:
+        partition_ratio = (T_ref/temperature)**1.5
+    else:
+        partition_ratio = partition_function(T_ref)/partition_function(temperature)
+    line_file = lines if isinstance(lines, (str, os.PathLike)) else None
+    if line_file is not None:
+        lines = open_line_list(line_file)
+
+    max_workers = max_workers or os.cpu_count()
+    n_blocks = min(n_blocks or 4*max_workers, wavenumber.size)
+    bounds = np.linspace(0, wavenumber.size, n_blocks + 1).astype(int)
+    # lines are shifted by at most |delta_air| p from their listed position, well inside the cutoff margin
+    first, last = np.searchsorted(lines.wavenumber, [wavenumber[bounds[:-1]] - 2*cutoff,
+                                                     wavenumber[bounds[1:] - 1] + 2*cutoff])
+    grids = [wavenumber[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+    args = (temperature, pressure, mass, partition_ratio, cutoff, max_pairs, min_intensity)
+
+    if max_workers == 1:
+        blocks = [_block_cross_section(LineList(*(np.asarray(field[lo:hi]) for field in lines)), grid, *args)
+                  for lo, hi, grid in zip(first, last, grids)]
+        return wavenumber, np.concatenate(blocks)
+
+    temporary = None
+    if line_file is None:
+        temporary = tempfile.TemporaryDirectory()
+        line_file = os.path.join(temporary.name, 'lines.npy')
+        save_line_list(line_file, lines)
+    try:
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+            futures = [pool.submit(_file_block_cross_section, line_file, lo, hi, grid, *args)
+                       for lo, hi, grid in zip(first, last, grids)]
+            blocks = [future.result() for future in futures]
+    finally:
+        if temporary is not None:
+            temporary.cleanup()
+    return wavenumber, np.concatenate(blocks)
+
+
+def line_by_line_loader(line_lists, masses, wavenumber, **kwargs):
+    '''
+    Loader for opacity_grid.build_opacity_grid that computes each grid point with cross_section.
+
+    Parameters
+    ----------
+    line_lists: dict
+        Species name to LineList, or to the name of its save_line_list file
+    masses: dict
+        Species name to molecular mass in amu
+    wavenumber: array
+        Grid to compute the cross sections on
+    kwargs:
+        Passed on to cross_section, e.g. cutoff or partition_function
+    '''
+    def loader(species, pressure, temperature):
+        return cross_section(line_lists[species], wavenumber, temperature, pressure, masses[species], **kwargs)
+    return loader
@@ -0,0 +1,178 @@
+"""
+Emission spectra rendered directly from line lists.
+
+Instead of sampling airglow lines on an ultra-fine grid and smoothing it down, render_lines spreads each line
+(center, integrated intensity) with the instrument profile straight onto the output pixels. Only the pixels within
+n_widths kernel widths of a line are touched, so the cost is the number of lines times the pixels per kernel, for
+any output grid and resolving power. The profile is integrated over each pixel, so narrow kernels on coarse pixels
+still conserve the line flux.
+
+lines_from_spectrum recovers a line list from a pre-sampled line spectrum such as data/irlinespec1.txt, and
+render_spectrum renders that list, keeping the result only where it matches smoothing the sampled spectrum.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from rebinning import bin_edges
+from smoothing import fwhm_to_sigma, smooth_to_resolution
+
+
+def _profile_cdf(kernel, x):
+    # cumulative profile at x, in units of the kernel FWHM from the line center
+    if kernel == 'gaussian':
+        from scipy.special import ndtr
+
+        return ndtr(x/fwhm_to_sigma)
+    elif kernel == 'boxcar':
+        return np.clip(x + 0.5, 0., 1.)
+    raise ValueError(f'unknown kernel {kernel}, use gaussian or boxcar')
+
+
+def render_lines(line_center, intensity, wavelength, R, kernel='gaussian', n_widths=3., max_pairs=2**22):
+    '''
+    Spectrum of emission lines at resolving power R, on an arbitrary wavelength grid.
+
+    Parameters
+    ----------
+    line_center: array
+        Line wavelengths
+    intensity: array
+        Integrated intensity of each line, e.g. photons/s/arcsec^2/m^2
+    wavelength: array
+        Ascending output grid, in the same unit as line_center. Each sample stands for the bin halfway to its
+        neighbours.
+    R: float, array, callable
+        Resolving power wavelength/FWHM. An array gives R per line; a callable is evaluated at the line centers.
+    kernel: str
+        'gaussian' or 'boxcar'
+    n_widths: float
+        Lines are spread over +- n_widths FWHM. 3 FWHM is 7 sigma of a gaussian; a boxcar only needs 0.5.
+    max_pairs: int
+        Largest number of (line, pixel) pairs evaluated at once, which bounds the working memory
+
+    Returns
+    -------
+    Flux density at wavelength: intensity per unit wavelength
+    '''
+    line_center = np.asarray(line_center, dtype=np.float64)
+    intensity = np.asarray(intensity, dtype=np.float64)
+    wavelength = np.asarray(wavelength, dtype=np.float64)
+    if callable(R):
+        R = R(line_center)
+    fwhm = np.broadcast_to(line_center/np.asarray(R, dtype=np.float64), line_center.shape)
+
+    edges = bin_edges(wavelength)
+    widths = np.diff(edges)
+    n_pix = wavelength.size
+    # pixels whose bins overlap center +- n_widths FWHM
+    first = np.clip(np.searchsorted(edges, line_center - n_widths*fwhm, side='right') - 1, 0, n_pix)
+    last = np.clip(np.searchsorted(edges, line_center + n_widths*fwhm, side='left') - 1, -1, n_pix - 1)
+    n_pairs = np.maximum(last - first + 1, 0)
+
+    flux = np.zeros(n_pix)
+    # split the lines so each group has at most max_pairs pairs (and at least one line)
+    pair_end = np.cumsum(n_pairs)
+    bounds = [0]
+    while bounds[-1] < line_center.size:
+        limit = (pair_end[bounds[-1] - 1] if bounds[-1] else 0) + max_pairs
+        bounds.append(max(int(np.searchsorted(pair_end, limit, side='right')), bounds[-1] + 1))
+
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        counts = n_pairs[start:stop]
+        line = np.repeat(np.arange(start, stop), counts)
+        pixel = np.repeat(first[start:stop], counts) + np.arange(counts.sum()) - \
+            np.repeat(np.cumsum(counts) - counts, counts)
+        lower = (edges[pixel] - line_center[line])/fwhm[line]
+        upper = (edges[pixel + 1] - line_center[line])/fwhm[line]
+        fraction = _profile_cdf(kernel, upper) - _profile_cdf(kernel, lower)
+        flux += np.bincount(pixel, weights=intensity[line]*fraction, minlength=n_pix)
+
+    return flux/widths
+
+
+def lines_from_spectrum(wavelength, spectrum, threshold=0.):
+    '''
+    Line list of a sampled emission line spectrum.
+
+    The spectrum is split at its local minima, and each segment becomes one line, at the intensity-weighted mean
+    wavelength of the segment, with the integral of the segment as its intensity.
+
+    Parameters
+    ----------
+    wavelength: array
+        Ascending wavelengths
+    spectrum: array
+        Flux density at wavelength, with lines on a continuum of about 0
+    threshold: float
+        Segments with an integrated intensity at or below threshold are dropped
+
+    Returns
+    -------
+    line_center, intensity: arrays
+    '''
+    wavelength = np.asarray(wavelength, dtype=np.float64)
+    spectrum = np.asarray(spectrum, dtype=np.float64)
+    flux = spectrum*np.diff(bin_edges(wavelength))
+
+    # segment boundaries: the first sample of every rise after a fall (or flat stretch)
+    slope = np.diff(spectrum)
+    starts = np.flatnonzero((slope[1:] > 0) & (slope[:-1] <= 0)) + 1
+    starts = np.concatenate(([0], starts))
+
+    intensity = np.add.reduceat(flux, starts)
+    weighted = np.add.reduceat(flux*wavelength, starts)
+    keep = intensity > threshold
+    return weighted[keep]/intensity[keep], intensity[keep]
+
+
+RenderedSpectrum = namedtuple('RenderedSpectrum', ['flux', 'rendered', 'difference'])
+RenderedSpectrum.__doc__ = '''
+A sampled line spectrum at resolving power R, from render_spectrum.
+
+flux: the rendered line list if it matched the smoothed spectrum, otherwise the smoothed spectrum
+rendered: True if flux is the rendered line list
+difference: largest difference between the rendered and smoothed spectra, as a fraction of the smoothed peak
+'''
+
+
+def render_spectrum(wavelength, spectrum, R, kernel='gaussian', tolerance=1e-2, reference=None, threshold=0.):
+    '''
+    Render a sampled line spectrum at resolving power R from its line list, and check it against smoothing.
+
+    lines_from_spectrum splits the spectrum at every local minimum, so noise and blended features become lines of
+    their own, and segments with a negative integral are dropped. The rendering also leaves out the width of the
+    lines themselves. Rendered at R = 2500, clean gaussian lines of R = 1e5 are within 0.1% of the peak of
+    smooth_to_resolution, and lines of R = 2e4 within 1%; noise of 0.1% of the peak makes that about 1%, and noise of
+    10% makes it 20% or more. Where the difference is above tolerance the smoothed spectrum is returned instead.
+
+    Parameters
+    ----------
+    wavelength, spectrum: arrays
+        Ascending wavelengths and the flux density at them, with lines on a continuum of about 0
+    R: float or callable
+        Resolving power
+    kernel: str
+        'gaussian' or 'boxcar'
+    tolerance: float
+        Largest accepted difference, as a fraction of the peak of the smoothed spectrum
+    reference: array, optional
+        smooth_to_resolution(wavelength, spectrum, R, kernel), if it is already at hand (e.g. from
+        cached_smooth_to_resolution)
+    threshold: float
+        Passed to lines_from_spectrum
+
+    Returns
+    -------
+    RenderedSpectrum
+    '''
+    if reference is None:
+        reference = smooth_to_resolution(wavelength, spectrum, R, kernel=kernel)
+    line_center, intensity = lines_from_spectrum(wavelength, spectrum, threshold=threshold)
+    rendered = render_lines(line_center, intensity, wavelength, R, kernel=kernel)
+
+    difference = np.max(np.abs(rendered - reference))/np.max(np.abs(reference))
+    if difference <= tolerance:
+        return RenderedSpectrum(rendered, True, difference)
+    return RenderedSpectrum(np.asarray(reference), False, difference)
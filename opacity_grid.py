@@ -0,0 +1,146 @@
+"""
+Cross sections of several species on a (pressure, temperature, wavenumber) grid.
+
+The cross sections are kept in one .npy file of shape (n_species, n_pressure, n_temperature, n_wavenumber), which is
+memory-mapped when opened, so an interpolation only reads the wavenumber slab it asks for. The axes are kept in a
+small .npz next to it. Interpolation is bilinear in (log10 pressure, temperature).
+"""
+
+from collections import namedtuple
+import os
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from toolkit import open_cross_section, window_indices, interpolation_weights
+
+OpacityGrid = namedtuple('OpacityGrid', ['species', 'pressure', 'temperature', 'wavenumber', 'cross_sections'])
+
+
+def _axes_file(filename):
+    return os.path.splitext(filename)[0] + '.axes.npz'
+
+
+def build_opacity_grid(filename, species, pressure, temperature, wavenumber, loader, dtype=np.float32):
+    '''
+    Write an opacity grid file, one (species, pressure, temperature) spectrum at a time.
+
+    Parameters
+    ----------
+    filename: str
+        Output .npy file. The axes are written to <filename without .npy>.axes.npz
+    species: list of str
+    pressure: array
+        Pressures of the grid, in bars, ascending
+    temperature: array
+        Temperatures of the grid, in K, ascending
+    wavenumber: array
+        Common wavenumber grid, ascending
+    loader: callable
+        loader(species, pressure, temperature) returns (wavenumber, cross_section) for one grid point, e.g. by
+        opening a line list file with toolkit.open_cross_section. The spectrum is interpolated onto wavenumber.
+    dtype:
+        Storage type of the cross sections
+
+    Returns
+    -------
+    OpacityGrid, opened from the new file
+    '''
+    pressure = np.asarray(pressure, dtype=np.float64)
+    temperature = np.asarray(temperature, dtype=np.float64)
+    wavenumber = np.asarray(wavenumber, dtype=np.float64)
+
+    cube = open_memmap(filename, mode='w+', dtype=dtype,
+                       shape=(len(species), pressure.size, temperature.size, wavenumber.size))
+    for i, name in enumerate(species):
+        for j, p in enumerate(pressure):
+            for k, t in enumerate(temperature):
+                wn, cross_section = loader(name, p, t)
+                cube[i, j, k] = np.interp(wavenumber, wn, cross_section, left=0., right=0.)
+    cube.flush()
+    del cube
+
+    np.savez(_axes_file(filename), species=np.asarray(species), pressure=pressure, temperature=temperature,
+             wavenumber=wavenumber)
+    return open_opacity_grid(filename)
+
+
+def cross_section_file_loader(pattern, skiplines=None):
+    '''
+    Loader for build_opacity_grid that reads precomputed cross section text files, such as
+    './line_lists/H2O_30mbar_1500K.txt'.
+
+    pattern is formatted with species, mbar (pressure in millibars, as an int) and T (as an int), e.g.
+    './line_lists/{species}_{mbar}mbar_{T}K.txt'
+    '''
+    def loader(species, pressure, temperature):
+        filename = pattern.format(species=species, mbar=int(round(pressure*1000)), T=int(round(temperature)))
+        return open_cross_section(filename, skiplines=skiplines)
+    return loader
+
+
+def open_opacity_grid(filename):
+    # the cross sections are memory-mapped, nothing is read until it is sliced
+    with np.load(_axes_file(filename)) as axes:
+        species = [str(name) for name in axes['species']]
+        pressure, temperature, wavenumber = axes['pressure'], axes['temperature'], axes['wavenumber']
+    return OpacityGrid(species, pressure, temperature, wavenumber, np.load(filename, mmap_mode='r'))
+
+
+def interpolate_opacity(grid, pressure, temperature, wn_range=None, species=None, chunk_size=256):
+    '''
+    Cross sections at arbitrary (pressure, temperature), reading only the requested wavenumber slab.
+
+    Parameters
+    ----------
+    grid: OpacityGrid
+        From open_opacity_grid
+    pressure, temperature: float or arrays
+        Points to interpolate to, in bars and K. Arrays are broadcast against each other for a batch of points.
+    wn_range: tuple, optional
+        (wn_start, wn_end), with the same nearest-point convention as toolkit.open_cross_section
+    species: list of str, optional
+        Subset of the species, in the order wanted. Defaults to all.
+    chunk_size: int
+        Number of (pressure, temperature) points read from the file at a time
+
+    Returns
+    -------
+    wavenumber: array
+        (n_wavenumber,) wavenumbers of the slab
+    cross_sections: array
+        (n_species, n_wavenumber) for a single point, the sigma_trace argument of transit_model.z_lambda, or
+        (n_points, n_species, n_wavenumber) for a batch
+    '''
+    if wn_range is None:
+        start, stop = 0, grid.wavenumber.size
+    else:
+        start, stop = (int(index[0]) for index in window_indices(grid.wavenumber, *wn_range))
+
+    names = grid.species if species is None else species
+    species_index = np.array([grid.species.index(name) for name in names], dtype=np.intp)
+    n_species = species_index.size
+
+    log_p, temperature = np.broadcast_arrays(np.log10(pressure), np.asarray(temperature, dtype=np.float64))
+    scalar = log_p.ndim == 0
+    log_p, temperature = log_p.ravel(), temperature.ravel()
+    ip, wp = interpolation_weights(np.log10(grid.pressure), log_p, 'pressure')
+    it, wt = interpolation_weights(grid.temperature, temperature, 'temperature')
+    ip1 = np.minimum(ip + 1, grid.pressure.size - 1)
+    it1 = np.minimum(it + 1, grid.temperature.size - 1)
+
+    result = np.empty((log_p.size, n_species, stop - start))
+    for first in range(0, log_p.size, chunk_size):
+        points = slice(first, first + chunk_size)
+        corners = ((ip[points], it[points], (1 - wp[points])*(1 - wt[points])),
+                   (ip1[points], it[points], wp[points]*(1 - wt[points])),
+                   (ip[points], it1[points], (1 - wp[points])*wt[points]),
+                   (ip1[points], it1[points], wp[points]*wt[points]))
+        block = result[points]
+        block[...] = 0
+        for p_index, t_index, weight in corners:
+            # (n_species, n_points, n_wavenumber) slab read from the memory map
+            slab = grid.cross_sections[species_index[:, None], p_index[None, :], t_index[None, :], start:stop]
+            block += weight[:, None, None]*np.moveaxis(slab, 1, 0)
+
+    return grid.wavenumber[start:stop], result[0] if scalar else result
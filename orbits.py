@@ -0,0 +1,40 @@
+"""
+Orbital quantities for planning observations of a transiting planet.
+
+Velocities are in m/s and times in seconds.
+"""
+
+import numpy as np
+
+from radiometry import c
+
+GM_sol = 1.327124e20  # m^3 s^-2 standard graviational parameter in solar masses
+
+
+def orbital_velocity(t_orbit, m_star):
+    '''
+    Orbital velocity K_p of a planet on a circular orbit, much less massive than its star.
+
+    Parameters
+    ----------
+    t_orbit: float, array
+        Orbital period, in seconds
+    m_star: float, array
+        Mass of the host star, in solar masses
+
+    Returns
+    -------
+    K_p, in m/s
+    '''
+    return (GM_sol * m_star * 2*np.pi/t_orbit)**(1/3)
+
+
+def delta_t_max(orbital_velocity, t_orbit, R=40000):
+    '''
+    Longest exposure before the planet lines move by half a resolution element, near conjunction.
+
+    R = lambda/delta-lambda, so delta-V_max = 1/2*c/R. With dV = K_p * 2pi * dphase and dphase = dt/t_orbit,
+    delta_t_max = 1/2 * 1/(2pi K_p) * c/R * t_orbit
+    '''
+    # this is technically modulated by a sin(i), where i is the inclination angle of the exoplanet orbit
+    return 0.5 * 1/(2*np.pi * orbital_velocity) * c/R * t_orbit
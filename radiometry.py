@@ -0,0 +1,101 @@
+"""
+Blackbody radiometry on plain float64 arrays.
+
+The kernels take SI values (wavelength in m, frequency in Hz, temperature in K) and skip astropy unit bookkeeping
+entirely. They are written in terms of exp(-x)/(-expm1(-x)) with x = hc/(lambda k T), which is accurate for small x and
+underflows to 0 instead of overflowing at short wavelengths. Temperatures and wavelengths broadcast, so
+planck_lambda(wavelength, temperatures[:, None]) evaluates a whole (n_temperatures, n_wavelengths) block.
+
+B_lambda and B_nu keep the astropy Quantity interface used by the scripts, converting units once at the boundary.
+"""
+
+import numpy as np
+
+# CODATA 2018, the same values as astropy.constants
+h = 6.62607015e-34  # J s
+c = 299792458.  # m/s
+k_B = 1.380649e-23  # J/K
+
+
+def _bose_factor(x):
+    # 1/(exp(x) - 1), without overflow for large x
+    return np.exp(-x)/-np.expm1(-x)
+
+
+def planck_lambda(wavelength, T):
+    '''
+    Planck spectral radiance per unit wavelength.
+
+    Parameters
+    ----------
+    wavelength: float, array
+        Wavelength in m
+    T: float, array
+        Temperature in K, broadcast against wavelength
+
+    Returns
+    -------
+    Spectral radiance, in J / (s m^3 sr), i.e. W m^-2 m^-1 sr^-1
+    '''
+    wavelength = np.asarray(wavelength, dtype=np.float64)
+    x = h*c/(wavelength*k_B*np.asarray(T, dtype=np.float64))
+    return 2*h*c**2/wavelength**5 * _bose_factor(x)
+
+
+def planck_nu(freq, T):
+    '''
+    Planck spectral radiance per unit frequency, in J / (s m^2 Hz sr). freq in Hz, T in K.
+    '''
+    freq = np.asarray(freq, dtype=np.float64)
+    x = h*freq/(k_B*np.asarray(T, dtype=np.float64))
+    return 2*h*freq**3/c**2 * _bose_factor(x)
+
+
+def photon_flux_lambda(wavelength, T):
+    '''
+    Planck photon radiance per unit wavelength, planck_lambda * wavelength/(h c).
+
+    Parameters
+    ----------
+    wavelength: float, array
+        Wavelength in m
+    T: float, array
+        Temperature in K, broadcast against wavelength
+
+    Returns
+    -------
+    Photon radiance, in photons / (s m^3 sr)
+    '''
+    wavelength = np.asarray(wavelength, dtype=np.float64)
+    x = h*c/(wavelength*k_B*np.asarray(T, dtype=np.float64))
+    return 2*c/wavelength**4 * _bose_factor(x)
+
+
+def planck_lambda_grid(wavelength, temperatures, photons=False):
+    '''
+    planck_lambda (or photon_flux_lambda, if photons) for every pair of temperatures and wavelengths.
+
+    Returns
+    -------
+    (n_temperatures, n_wavelengths) array
+    '''
+    kernel = photon_flux_lambda if photons else planck_lambda
+    return kernel(np.asarray(wavelength)[None, :], np.asarray(temperatures, dtype=np.float64)[:, None])
+
+
+def B_lambda(wavelength, T):
+    '''
+    planck_lambda for astropy Quantities. Produces units of J / (s m3), like the original unit-based version.
+    '''
+    import astropy.units as u
+
+    return planck_lambda(u.Quantity(wavelength, u.m).value, u.Quantity(T, u.K).value) * u.J/(u.s*u.m**3)
+
+
+def B_nu(freq, T):
+    '''
+    planck_nu for astropy Quantities. Produces units of J / (s m2 Hz).
+    '''
+    import astropy.units as u
+
+    return planck_nu(u.Quantity(freq, u.Hz).value, u.Quantity(T, u.K).value) * u.J/(u.s*u.m**2*u.Hz)
@@ -0,0 +1,143 @@
+"""
+Flux-conserving rebinning between wavelength grids.
+
+Every sample is treated as the mean flux density over its bin, with bin edges halfway between neighbouring samples.
+Rebinning onto another grid then averages each target bin over the source bins it overlaps, weighted by the width of
+each overlap. Going from a fine to a coarse grid this conserves flux and does not alias narrow lines the way point
+sampling with np.interp does. Going from a coarse to a fine grid it gives the bin value of the source, a staircase
+with the same integral.
+
+Each target bin is divided by its full width, so the integral of the rebinned spectrum equals the integral of the
+source over the part of the source grid the target covers, exactly. Target bins that stick out past the ends of the
+source grid are diluted by the uncovered part (0 entirely outside it); coverage gives the covered fraction of each
+target bin, to clip the target grid or to correct for it.
+
+The weights form a sparse (n_target, n_source) matrix. It depends only on the two grids, so rebin_matrix keeps the
+matrices it builds, keyed by a hash of the grids, and rebinning a whole block of spectra onto the same grid is one
+sparse matrix product. scipy is only imported when a matrix is built.
+"""
+
+from collections import OrderedDict
+import os
+
+import numpy as np
+
+from toolkit import array_digest
+
+_matrix_cache = OrderedDict()
+max_cached_matrices = 16
+
+
+def bin_edges(centers):
+    '''
+    Edges of the bins around ascending sample points: the midpoints, with the end bins as wide as their neighbours.
+    '''
+    centers = np.asarray(centers, dtype=np.float64)
+    if centers.size == 1:
+        raise ValueError('the bin width of a single sample is undefined')
+    middle = 0.5*(centers[1:] + centers[:-1])
+    return np.concatenate(([2*centers[0] - middle[0]], middle, [2*centers[-1] - middle[-1]]))
+
+
+def grid_fingerprint(grid):
+    # shape and contents; used for the in-memory and on-disk caches
+    return array_digest(grid)[:16]
+
+
+def _overlap_matrix(source_edges, target_edges):
+    import scipy.sparse
+
+    n_source = source_edges.size - 1
+    n_target = target_edges.size - 1
+    # the target bins overlapping source bin i are first[i] .. last[i]
+    first = np.clip(np.searchsorted(target_edges, source_edges[:-1], side='right') - 1, 0, n_target)
+    last = np.clip(np.searchsorted(target_edges, source_edges[1:], side='left') - 1, -1, n_target - 1)
+    n_pairs = np.maximum(last - first + 1, 0)
+
+    source = np.repeat(np.arange(n_source), n_pairs)
+    target = np.repeat(first, n_pairs) + np.arange(n_pairs.sum()) - np.repeat(np.cumsum(n_pairs) - n_pairs, n_pairs)
+    overlap = np.minimum(source_edges[source + 1], target_edges[target + 1]) - \
+        np.maximum(source_edges[source], target_edges[target])
+    keep = overlap > 0
+    matrix = scipy.sparse.csr_matrix((overlap[keep], (target[keep], source[keep])), shape=(n_target, n_source))
+
+    # divide by the full width of each target bin, which conserves the flux
+    return scipy.sparse.diags(1/np.diff(target_edges)) @ matrix
+
+
+def coverage(source_wavelength, target_wavelength):
+    '''
+    Fraction of each target bin that lies within the bins of the source grid: 1 inside, 0 outside, and in between
+    for the bins straddling its ends.
+    '''
+    source_edges = bin_edges(source_wavelength)
+    target_edges = bin_edges(target_wavelength)
+    overlap = np.minimum(target_edges[1:], source_edges[-1]) - np.maximum(target_edges[:-1], source_edges[0])
+    return np.clip(overlap/np.diff(target_edges), 0., 1.)
+
+
+def rebin_matrix(source_wavelength, target_wavelength, cache_dir=None):
+    '''
+    Sparse matrix rebinning spectra sampled at source_wavelength onto target_wavelength.
+
+    Parameters
+    ----------
+    source_wavelength, target_wavelength: arrays
+        Ascending sample points (bin centers) of the two grids, in the same unit
+    cache_dir: str, optional
+        Also keep the matrix on disk, as a scipy .npz named after the grid fingerprints
+
+    Returns
+    -------
+    (n_target, n_source) scipy.sparse.csr_matrix. Target bins partly outside the source grid are diluted by the
+    uncovered fraction, and bins entirely outside it are 0, see coverage.
+    '''
+    source_wavelength = np.asarray(source_wavelength, dtype=np.float64)
+    target_wavelength = np.asarray(target_wavelength, dtype=np.float64)
+    if source_wavelength[0] > source_wavelength[-1] or target_wavelength[0] > target_wavelength[-1]:
+        raise ValueError('rebin_matrix needs ascending wavelengths')
+
+    key = grid_fingerprint(source_wavelength) + '.' + grid_fingerprint(target_wavelength)
+    if key in _matrix_cache:
+        _matrix_cache.move_to_end(key)
+        return _matrix_cache[key]
+
+    import scipy.sparse
+
+    cache_file = None if cache_dir is None else os.path.join(cache_dir, f'rebin.{key}.npz')
+    if cache_file is not None and os.path.exists(cache_file):
+        matrix = scipy.sparse.load_npz(cache_file).tocsr()
+    else:
+        matrix = _overlap_matrix(bin_edges(source_wavelength), bin_edges(target_wavelength)).tocsr()
+        if cache_file is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            scipy.sparse.save_npz(cache_file + '.tmp.npz', matrix)
+            os.replace(cache_file + '.tmp.npz', cache_file)
+
+    _matrix_cache[key] = matrix
+    if len(_matrix_cache) > max_cached_matrices:
+        _matrix_cache.popitem(last=False)
+    return matrix
+
+
+def rebin(source_wavelength, target_wavelength, flux, cache_dir=None):
+    '''
+    Flux-conserving rebinning of one spectrum or a block of spectra.
+
+    Parameters
+    ----------
+    source_wavelength, target_wavelength: arrays
+        Ascending sample points of the two grids
+    flux: array
+        (..., n_source) flux densities at source_wavelength, e.g. one spectrum or (n_exposures, n_source)
+    cache_dir: str, optional
+        See rebin_matrix
+
+    Returns
+    -------
+    (..., n_target) array
+    '''
+    matrix = rebin_matrix(source_wavelength, target_wavelength, cache_dir=cache_dir)
+    flux = np.asarray(flux)
+    rows = flux.reshape(-1, flux.shape[-1])
+    return np.asarray(matrix @ rows.T).T.reshape(flux.shape[:-1] + (matrix.shape[0],))
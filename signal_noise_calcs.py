@@ -2,23 +2,21 @@
 This script is for calculating simple signal/noise for the hi-res feasibility study.
 
 To keep things simple, this uses an Earth atmosphere absorption spectrum, which I happened to have lying around.
+The calculations are budget.cc_snr_estimates; this script only loads the spectrum, prints and plots.
+BALLOON_INJECTION=1 adds the injection-recovery check of injection.py, which takes a while.
 """
 
-import matplotlib
-matplotlib.use("qt5agg")
-import numpy as np
-import matplotlib.pyplot as plt
+import os
 
-from scipy.ndimage import gaussian_filter
-
-from toolkit import snr_calculator
+from smoothing import smooth_file
+from budget import cc_snr_estimates
+from injection import injection_recovery
+from instrumentation import enable_from_env, stage
 
 # housekeeping variables
 debug=True
 # resolution = 117500  # resolution of the mk data, assuming nyquist sampling
 resolution = 40000
-igrins_hband = np.array((1.47, 1.8))  # um
-igrins_kband = np.array((1.96, 2.46))  # um
 # In Peter's paper, it says they discard 8 orders, but it doesn't say which ones.
 
 R_gem = 8.1/2  # m
@@ -27,58 +25,60 @@ R_giga = 1.35/2  # m
 
 # open files
 gemini_trans_file = 'data/mktrans_zm_16_15.dat'
-mk_trans_data = np.loadtxt(gemini_trans_file)
-
-wl = mk_trans_data[:, 0]  # um
-raw_spectrum = mk_trans_data[:, 1]
-
-# filter the data down to the resolution, using a gaussian
-sigma = 1/2.355 * np.mean(wl)/np.mean(np.diff(wl)) * 1/resolution
-
-filtered_spectrum = gaussian_filter(raw_spectrum, sigma)
 
-if debug:
-    # plot the results of the filter
-    test_fig, test_ax = plt.subplots(figsize=(8, 6))
-    test_ax.plot(wl, 1 - filtered_spectrum, label=f'R={resolution}')
-    # test_ax.plot(wl, 1-raw_spectrum, label='Raw spectrum data', color='r', alpha=0.5)
-    test_ax.set_xlabel('wavelength (um)')
-    test_ax.set_ylabel('Fractional Transparency')
-    test_ax.set_xlim(1.47, 2.5)
-    test_ax.legend()
-
-
-# calculate SNR estimates
 planet_contrast = 1e-3
 snr_gem = 200
-oversample = 1/2 * filtered_spectrum.size / resolution
 exposure_time = 3600 * 4.7  # s
 
-usable_spectrum = (wl > 1.56) * (wl < 1.62)
-N_lines_gem = np.sum((1-filtered_spectrum[usable_spectrum])**2)
-# N_lines_gem = np.sum(1-filtered_spectrum[usable_spectrum])/3
-# N_lines_gem = ((1-raw_spectrum[usable_spectrum])**2).sum()   # 10.4
-snr_cc_gem = snr_calculator(snr_gem, exposure_time, R_gem, planet_contrast, N_lines_gem, r_ref=R_gem)
-
-print(f'SNR cc, Gemini: {snr_cc_gem: .2f}')
-
-# full igrins spectrum
-hband = (wl > igrins_hband[0]) * (wl < igrins_hband[1])
-kband = (wl > igrins_kband[0]) * (wl < igrins_kband[1])
-
-N_lines_igrins = np.sum( (1 - filtered_spectrum[hband+kband]))
-snr_cc_igrins = snr_calculator(snr_gem, exposure_time, R_gem, planet_contrast, N_lines_igrins, r_ref=R_gem)
-print(f'SNR cc, full igrins spectrum on Gemini: {snr_cc_igrins: .2f}')
-
-# superbit and gigabit platforms
-usable_spectrum = (wl > 1.47) * (wl < 2.5)
-N_lines_super = np.sum((1-filtered_spectrum[usable_spectrum])**2)
-snr_cc_superbit = snr_calculator(snr_gem, exposure_time, R_super, planet_contrast, N_lines_super, r_ref=R_gem)
-print(f'SNR cc, Superbit platform: {snr_cc_superbit: .2f}')
-
-snr_cc_gigabit = snr_calculator(snr_gem, exposure_time, R_giga, planet_contrast, N_lines_super, r_ref=R_gem)
-print(f'SNR cc, Gigabit platform: {snr_cc_gigabit: .2f}')
-
-
-
 
+def main():
+    # BALLOON_PROFILE=1 prints the time spent in each stage at exit, see instrumentation.py
+    enable_from_env()
+
+    # filter the data down to the resolution, using a gaussian with FWHM = wl/resolution
+    # the result is cached next to the data file, so reruns at the same resolution skip the text parse and the convolution
+    with stage('load_and_smoothing'):
+        wl, filtered_spectrum = smooth_file(gemini_trans_file, resolution)  # um
+
+    # calculate SNR estimates: the CO2 band at Gemini, the full igrins spectrum on Gemini, and the superbit and
+    # gigabit platforms over 1.47-2.5 um
+    with stage('snr'):
+        snr = cc_snr_estimates(wl, filtered_spectrum, snr_gem, R_gem, exposure_time, planet_contrast,
+                               platforms={'Superbit': R_super, 'Gigabit': R_giga})
+    # N_lines_gem = np.sum(1-filtered_spectrum[usable_spectrum])/3
+    # N_lines_gem = ((1-raw_spectrum[usable_spectrum])**2).sum()   # 10.4
+    print(f'SNR cc, Gemini: {snr.band: .2f}')
+
+    # BALLOON_INJECTION=1 checks the scaling against simulated data: the planet lines are injected into photon noise
+    # and recovered by cross-correlation, on a process pool
+    if os.environ.get('BALLOON_INJECTION', '0') not in ('', '0'):
+        co2_band = (wl > 1.56) & (wl < 1.62)
+        with stage('injection_recovery'):
+            injected = injection_recovery(filtered_spectrum[co2_band], snr_gem, exposure_time, planet_contrast,
+                                          n_realizations=2000, seed=0)
+        print(f'SNR cc, Gemini, injection-recovery: {injected.empirical_snr: .2f} '
+              f'(analytic {injected.analytic_snr: .2f})')
+
+    print(f'SNR cc, full igrins spectrum on Gemini: {snr.igrins: .2f}')
+    snr_cc_superbit, snr_cc_gigabit = snr.platforms.values
+    print(f'SNR cc, Superbit platform: {snr_cc_superbit: .2f}')
+    print(f'SNR cc, Gigabit platform: {snr_cc_gigabit: .2f}')
+
+    # pyplot (and with it Qt) is only loaded after the process pool of the injection check has been used
+    import matplotlib.pyplot as plt
+
+    if debug:
+        # plot the results of the filter
+        test_fig, test_ax = plt.subplots(figsize=(8, 6))
+        test_ax.plot(wl, 1 - filtered_spectrum, label=f'R={resolution}')
+        # test_ax.plot(wl, 1-raw_spectrum, label='Raw spectrum data', color='r', alpha=0.5)
+        test_ax.set_xlabel('wavelength (um)')
+        test_ax.set_ylabel('Fractional Transparency')
+        test_ax.set_xlim(1.47, 2.5)
+        test_ax.legend()
+
+
+if __name__ == '__main__':
+    import matplotlib
+    matplotlib.use("qt5agg")
+    main()
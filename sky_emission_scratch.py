@@ -1,11 +1,7 @@
-import numpy as np
-import matplotlib
-matplotlib.use("qt5agg")
-import matplotlib.pyplot as plt
 # import astropy.units as u
 # from argparse import ArgumentParser
-import lowtran
 # from lowtran.plot import irradiance
+from sky_model import run_sky_models
 
 c1 = {
     "model": 1,  # model selection
@@ -20,46 +16,52 @@ c1 = {
 # 4 subarctic summer 5 subarctic winter 6 1976 US standard
 # mid latitude: 23.5-66.5
 
-trans = lowtran.transmittance(c1)
-wl = np.array(trans.transmission['wavelength_nm']) * 1.0e-3  # convert to microns
+# excite transmission
+c_mc = dict(c1, model=4, h1=38.)
 
-# keck transmission
-t_k = np.array(trans.transmission[0, :, 0])
-sc_k = np.array(lowtran.scatter(c1)['pathscatter'][0, :, 0])
-ra_k = np.array(lowtran.radiance(c1)['radiance'][0, :, 0])
+seeing = 0.35
 
-# excite transmission
-c1['model'] = 4
-c1['h1'] = 38.
-trans_mc = lowtran.transmittance(c1)
-t_e = np.array(trans_mc.transmission[0, :, 0])
-sc_e = np.array(lowtran.scatter(c1)['pathscatter'][0, :, 0])
-ra_e = np.array(lowtran.radiance(c1)['radiance'][0, :, 0])
 
-# irradiance(irr, c1, True)
-fig, (ax_trans, ax_em) = plt.subplots(2, tight_layout=True, figsize=(9,6))
+def main():
+    import matplotlib.pyplot as plt
 
-ax_trans.plot(wl, t_k, label='Mauna Kea')
-ax_trans.plot(wl, t_e, label=f'McMurdo, {c1["h1"]} km')
-ax_trans.set_xlabel('wavelength (um)')
-ax_trans.set_ylabel('Atmosphere transmission')
-ax_trans.set_xlim(1.5, 2.5)
-ax_trans.set_ylim(0.98, 1.01)
-ax_trans.legend()
+    # both atmospheres are run in parallel, and cached for later runs
+    keck, excite = run_sky_models([c1, c_mc])
+    wl = keck.wavelength  # microns
 
-# ax_em.plot(wl, sc_k, label='Mauna Kea scattered light')
-ax_em.plot(wl, ra_k, label='MK atmospheric emission')
-# ax_em.plot(wl, sc_e, label='Antartic scattered light')
-ax_em.plot(wl, ra_e, label = 'Antartic At12mospheric emission')
-ax_em.set_xlabel('Wavelength (um)')
-ax_em.set_ylabel('Radiance (W /ster /cm^2 /um)')
-ax_em.set_xlim(1.5, 2.5)
-ax_em.legend()
+    # keck transmission
+    t_k = keck.transmission
+    # sc_k = keck.pathscatter
+    ra_k = keck.radiance
 
-plt.show()
+    t_e = excite.transmission
+    # sc_e = excite.pathscatter
+    ra_e = excite.radiance
 
-seeing = 0.35
+    # irradiance(irr, c1, True)
+    fig, (ax_trans, ax_em) = plt.subplots(2, tight_layout=True, figsize=(9,6))
+
+    ax_trans.plot(wl, t_k, label='Mauna Kea')
+    ax_trans.plot(wl, t_e, label=f'McMurdo, {c_mc["h1"]} km')
+    ax_trans.set_xlabel('wavelength (um)')
+    ax_trans.set_ylabel('Atmosphere transmission')
+    ax_trans.set_xlim(1.5, 2.5)
+    ax_trans.set_ylim(0.98, 1.01)
+    ax_trans.legend()
 
+    # ax_em.plot(wl, sc_k, label='Mauna Kea scattered light')
+    ax_em.plot(wl, ra_k, label='MK atmospheric emission')
+    # ax_em.plot(wl, sc_e, label='Antartic scattered light')
+    ax_em.plot(wl, ra_e, label = 'Antartic At12mospheric emission')
+    ax_em.set_xlabel('Wavelength (um)')
+    ax_em.set_ylabel('Radiance (W /ster /cm^2 /um)')
+    ax_em.set_xlim(1.5, 2.5)
+    ax_em.legend()
 
+    plt.show()
 
 
+if __name__ == '__main__':
+    import matplotlib
+    matplotlib.use("qt5agg")
+    main()
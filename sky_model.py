@@ -0,0 +1,200 @@
+"""
+LOWTRAN sky model runs, memoized on disk.
+
+Each configuration dict (the c1 dicts of sky_emission_scratch.py) is run once for the transmission, path scattered
+radiance and thermal radiance, and the result is stored in a .npz keyed by a hash of the full configuration. Later
+runs of the same configuration load the .npz instead of calling LOWTRAN. Lists of configurations are spread over a
+process pool.
+
+build_sky_cube runs a grid of altitudes and zenith angles and saves it as one memory-mappable cube, and
+query_sky_cube interpolates that cube to any (altitude, angle) without running LOWTRAN again.
+
+lowtran is only imported when a model actually has to be run.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+from toolkit import interpolation_weights
+
+SkyModel = namedtuple('SkyModel', ['wavelength', 'transmission', 'pathscatter', 'radiance'])
+
+default_cache_dir = os.path.join('data', 'lowtran_cache')
+
+
+def config_key(config):
+    # configurations that differ in any entry, including the wavelength range and step, get different keys
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+def _run_lowtran(config):
+    import lowtran
+
+    # each lowtran call modifies the dict it is given, so each gets its own copy
+    trans = lowtran.transmittance(dict(config))
+    wavelength = np.array(trans.transmission['wavelength_nm']) * 1.0e-3  # convert to microns
+    transmission = np.array(trans.transmission[0, :, 0])
+    pathscatter = np.array(lowtran.scatter(dict(config))['pathscatter'][0, :, 0])
+    radiance = np.array(lowtran.radiance(dict(config))['radiance'][0, :, 0])
+
+    return SkyModel(wavelength, transmission, pathscatter, radiance)
+
+
+def _cache_file(config, cache_dir):
+    return os.path.join(cache_dir, f'lowtran.{config_key(config)}.npz')
+
+
+def _load(cache_file):
+    with np.load(cache_file) as data:
+        return SkyModel(*(data[field] for field in SkyModel._fields))
+
+
+def _run_and_cache(config, cache_dir):
+    model = _run_lowtran(config)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        cache_file = _cache_file(config, cache_dir)
+        # write under a temporary name, so parallel runs never read a half written file
+        np.savez(cache_file + '.tmp.npz', config=json.dumps(config, sort_keys=True), **model._asdict())
+        os.replace(cache_file + '.tmp.npz', cache_file)
+    return model
+
+
+def run_sky_model(config, cache_dir=default_cache_dir):
+    '''
+    Transmission, path scatter and radiance of one LOWTRAN configuration.
+
+    Parameters
+    ----------
+    config: dict
+        LOWTRAN configuration, e.g. {"model": 1, "h1": 4.2, "angle": 45, "wlshort": 800, "wllong": 3500, "wlstep": 10}
+    cache_dir: str, optional
+        Directory of the cached results. None disables the cache.
+
+    Returns
+    -------
+    SkyModel
+        namedtuple of (wavelength in um, transmission, pathscatter, radiance), radiance in W /ster /cm^2 /um
+    '''
+    if cache_dir is not None and os.path.exists(_cache_file(config, cache_dir)):
+        return _load(_cache_file(config, cache_dir))
+    return _run_and_cache(config, cache_dir)
+
+
+def run_sky_models(configs, cache_dir=default_cache_dir, max_workers=None):
+    '''
+    run_sky_model for a list of configurations. Configurations that are not cached are run in parallel, one process
+    per configuration, up to max_workers at a time.
+
+    Returns
+    -------
+    list of SkyModel, in the order of configs
+    '''
+    models = [None]*len(configs)
+    pending = {}
+    for i, config in enumerate(configs):
+        if cache_dir is not None and os.path.exists(_cache_file(config, cache_dir)):
+            models[i] = _load(_cache_file(config, cache_dir))
+        else:
+            # identical configurations in the list are only run once
+            pending.setdefault(config_key(config), []).append(i)
+
+    if pending:
+        # fork where available, so the scripts calling this don't need an if __name__ == '__main__' guard
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+            futures = {key: pool.submit(_run_and_cache, configs[indices[0]], cache_dir)
+                       for key, indices in pending.items()}
+            for key, indices in pending.items():
+                model = futures[key].result()
+                for i in indices:
+                    models[i] = model
+
+    return models
+
+
+SkyCube = namedtuple('SkyCube', ['altitude', 'angle', 'wavelength', 'transmission', 'pathscatter', 'radiance'])
+
+
+def build_sky_cube(filename, base_config, altitudes, angles, cache_dir=default_cache_dir, max_workers=None):
+    '''
+    Run LOWTRAN over a grid of altitude and zenith angle, and save the results as a memory-mappable cube.
+
+    Parameters
+    ----------
+    filename: str
+        Output .npy file, holding a (3, n_altitude, n_angle, n_wavelength) float64 array of transmission, path
+        scatter and radiance. The axes go in <filename without .npy>.axes.npz
+    base_config: dict
+        LOWTRAN configuration for the site model and wavelength range; h1 and angle are replaced by the grid values
+    altitudes: array
+        Observer altitudes, in km, ascending
+    angles: array
+        Zenith angles, in degrees, ascending
+    cache_dir, max_workers:
+        See run_sky_models
+
+    Returns
+    -------
+    SkyCube, opened from the new file
+    '''
+    altitudes = np.asarray(altitudes, dtype=np.float64)
+    angles = np.asarray(angles, dtype=np.float64)
+    configs = [dict(base_config, h1=float(h1), angle=float(angle)) for h1 in altitudes for angle in angles]
+    models = run_sky_models(configs, cache_dir=cache_dir, max_workers=max_workers)
+
+    cube = np.stack([np.stack([model.transmission, model.pathscatter, model.radiance]) for model in models], axis=1)
+    cube = cube.reshape(3, altitudes.size, angles.size, -1)
+    np.save(filename, cube)
+    np.savez(os.path.splitext(filename)[0] + '.axes.npz', altitude=altitudes, angle=angles,
+             wavelength=models[0].wavelength, config=json.dumps(base_config, sort_keys=True))
+
+    return open_sky_cube(filename)
+
+
+def open_sky_cube(filename):
+    # the products are views into one memory map, nothing is read until the cube is queried
+    with np.load(os.path.splitext(filename)[0] + '.axes.npz') as axes:
+        altitude, angle, wavelength = axes['altitude'], axes['angle'], axes['wavelength']
+    transmission, pathscatter, radiance = np.load(filename, mmap_mode='r')
+    return SkyCube(altitude, angle, wavelength, transmission, pathscatter, radiance)
+
+
+def query_sky_cube(cube, altitude, angle, products=('transmission', 'pathscatter', 'radiance')):
+    '''
+    Sky spectra at any (altitude, zenith angle) inside the cube, by bilinear interpolation.
+
+    Parameters
+    ----------
+    cube: SkyCube
+        From open_sky_cube or build_sky_cube
+    altitude, angle: float or arrays
+        Observer altitudes in km and zenith angles in degrees, broadcast against each other, e.g. one entry per
+        exposure of a flight
+    products: tuple
+        Which of transmission, pathscatter and radiance to return
+
+    Returns
+    -------
+    dict of product name to an array of shape altitude.shape + (n_wavelength,)
+    '''
+    altitude, angle = np.broadcast_arrays(np.asarray(altitude, dtype=np.float64), np.asarray(angle, dtype=np.float64))
+    shape = altitude.shape
+    ia, wa = interpolation_weights(cube.altitude, altitude.ravel(), 'altitude')
+    iz, wz = interpolation_weights(cube.angle, angle.ravel(), 'angle')
+    ia1 = np.minimum(ia + 1, cube.altitude.size - 1)
+    iz1 = np.minimum(iz + 1, cube.angle.size - 1)
+
+    result = {}
+    for name in products:
+        values = getattr(cube, name)
+        spectra = ((1 - wa)*(1 - wz))[:, None]*values[ia, iz] + (wa*(1 - wz))[:, None]*values[ia1, iz] \
+            + ((1 - wa)*wz)[:, None]*values[ia, iz1] + (wa*wz)[:, None]*values[ia1, iz1]
+        result[name] = spectra.reshape(shape + (cube.wavelength.size,))
+    return result
@@ -0,0 +1,463 @@
+"""
+Functions for degrading spectra to a given resolving power.
+
+The spectrum is resampled onto a grid that is uniform in log-wavelength, where a constant-R line spread function has
+the same width everywhere, convolved with an FFT, and interpolated back onto the input wavelengths. A
+wavelength-dependent R is handled by stretching the log-wavelength axis so the kernel width is constant on the
+stretched grid.
+
+For spectra too large to hold in memory, smooth_to_resolution_out_of_core does the same in overlapping chunks of a
+memory-mapped spectrum, and gaussian_filter_out_of_core applies scipy.ndimage.gaussian_filter (a kernel of fixed width
+in samples) the same way. Both write the result to a memory-mapped file.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import hashlib
+import os
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from instrumentation import count
+from toolkit import array_digest, cache_path, source_stamp
+
+fwhm_to_sigma = 1/(2*np.sqrt(2*np.log(2)))  # ~1/2.355
+default_cache_dir = os.path.join('data', 'smoothing_cache')
+
+
+def _resolution_coordinate(ln_wl, R):
+    '''
+    Coordinate u along which the kernel width is constant, and the reference R0 that sets the kernel width.
+
+    For a constant R, u is ln(wavelength). Otherwise du = R(wl)/R0 dln(wl), so a kernel of FWHM 1/R0 in u has FWHM
+    1/R(wl) in ln(wavelength).
+    '''
+    if callable(R):
+        R = R(np.exp(ln_wl))
+    R = np.asarray(R, dtype=np.float64)
+    if R.ndim == 0:
+        return ln_wl, float(R)
+
+    R = np.broadcast_to(R, ln_wl.shape)
+    R0 = float(np.min(R))
+    u = np.concatenate(([0.], np.cumsum(0.5*(R[1:] + R[:-1])/R0 * np.diff(ln_wl)))) + ln_wl[0]
+    return u, R0
+
+
+def _kernel(kernel, fwhm_px):
+    if kernel == 'gaussian':
+        sigma = fwhm_px * fwhm_to_sigma
+        half_width = max(int(np.ceil(4*sigma)), 1)
+        x = np.arange(-half_width, half_width + 1)
+        weights = np.exp(-0.5*(x/sigma)**2)
+    elif kernel == 'boxcar':
+        half_width = max(int(np.round(fwhm_px/2)), 0)
+        weights = np.ones(2*half_width + 1)
+    else:
+        raise ValueError(f'unknown kernel {kernel}, use gaussian or boxcar')
+
+    return weights/weights.sum()
+
+
+def smooth_to_resolution(wavelength, spectrum, R, kernel='gaussian', samples_per_fwhm=4):
+    '''
+    Convolve a spectrum down to resolving power R = wavelength/FWHM.
+
+    Parameters
+    ----------
+    wavelength: array
+        Wavelengths of the spectrum, ascending or descending. Need not be evenly spaced.
+    spectrum: array
+        Spectrum sampled at wavelength. Extra trailing axes are not supported; smooth each spectrum separately.
+    R: float, array or callable
+        Resolving power. An array must match wavelength; a callable is evaluated at wavelength.
+    kernel: str
+        Line spread function, 'gaussian' (FWHM = wavelength/R) or 'boxcar' (width = wavelength/R)
+    samples_per_fwhm: float
+        Minimum sampling of the kernel on the internal log-wavelength grid. The grid is never coarser than the median
+        sampling of the input.
+
+    Returns
+    -------
+    The smoothed spectrum, at the input wavelengths
+    '''
+    wavelength = np.asarray(wavelength, dtype=np.float64)
+    spectrum = np.asarray(spectrum, dtype=np.float64)
+
+    descending = wavelength[0] > wavelength[-1]
+    if descending:
+        wavelength = wavelength[::-1]
+        spectrum = spectrum[::-1]
+
+    u, R0 = _resolution_coordinate(np.log(wavelength), R)
+
+    # uniform grid in u, fine enough for both the kernel and the input sampling
+    step = min(np.median(np.diff(u)), 1/(R0*samples_per_fwhm))
+    smoothed = _convolve_on_grid(u, spectrum, R0, step, u[0], kernel)
+    return smoothed[::-1] if descending else smoothed
+
+
+def _convolve_on_grid(u, spectrum, R0, step, u0, kernel):
+    # resample onto the points u0 + k*step covering u, convolve with a kernel of FWHM 1/R0, and interpolate back
+    from scipy.signal import fftconvolve
+
+    first = int(np.floor((u[0] - u0)/step))
+    last = int(np.ceil((u[-1] - u0)/step))
+    u_grid = u0 + step*np.arange(first, last + 1)
+    resampled = np.interp(u_grid, u, spectrum)
+
+    weights = _kernel(kernel, 1/(R0*step))
+    half_width = weights.size//2
+    # reflect at the edges, the same as the default mode of scipy.ndimage.gaussian_filter
+    padded = np.pad(resampled, half_width, mode='symmetric')
+    smoothed = fftconvolve(padded, weights, mode='valid')
+    return np.interp(u, u_grid, smoothed)
+
+
+def _file_digest(filename, block_size=2**24):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cached_file_digest(filename, cache_dir=None):
+    # hashing a large file is not free, so the digest is kept until the size or mtime of the file changes
+    stamp = source_stamp(filename)
+    digest_file = cache_path(filename, 'sha1', cache_dir=cache_dir, ext='.txt')
+    try:
+        with open(digest_file) as file:
+            size, mtime_ns, digest = file.read().split()
+        if (int(size), int(mtime_ns)) == (stamp['size'], stamp['mtime_ns']):
+            return digest
+    except (OSError, ValueError):
+        pass
+
+    digest = _file_digest(filename)
+    try:
+        with open(digest_file, 'w') as file:
+            file.write(f'{stamp["size"]} {stamp["mtime_ns"]} {digest}')
+    except OSError:
+        pass
+    return digest
+
+
+def _resolution_tag(R, kernel, samples_per_fwhm):
+    if callable(R):
+        raise ValueError('results for a callable R cannot be cached; pass R evaluated on the wavelengths instead')
+    R = np.asarray(R, dtype=np.float64)
+    R_tag = f'R{float(R):g}' if R.ndim == 0 else 'R' + array_digest(R)[:12]
+    return f'{R_tag}.{kernel}.s{samples_per_fwhm:g}'
+
+
+def cached_smooth_to_resolution(wavelength, spectrum, R, kernel='gaussian', samples_per_fwhm=4, cache=True,
+                                cache_dir=default_cache_dir):
+    '''
+    smooth_to_resolution, memoized on disk by a hash of the input spectrum, R and the kernel.
+
+    Results are kept in cache_dir (data/smoothing_cache by default) and memory-mapped on later calls. With
+    cache=False this is the same as smooth_to_resolution.
+    '''
+    if not cache:
+        return smooth_to_resolution(wavelength, spectrum, R, kernel=kernel, samples_per_fwhm=samples_per_fwhm)
+
+    key = array_digest(wavelength, spectrum) + '.' + _resolution_tag(R, kernel, samples_per_fwhm)
+    cache_file = os.path.join(cache_dir, f'smooth.{key}.npy')
+    if os.path.exists(cache_file):
+        count('smoothing.cache_hit')
+        return np.load(cache_file, mmap_mode='r')
+    count('smoothing.cache_miss')
+
+    smoothed = smooth_to_resolution(wavelength, spectrum, R, kernel=kernel, samples_per_fwhm=samples_per_fwhm)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(cache_file + '.tmp.npy', smoothed)
+        os.replace(cache_file + '.tmp.npy', cache_file)
+    except OSError:
+        pass
+    return smoothed
+
+
+def smooth_file(filename, R, kernel='gaussian', samples_per_fwhm=4, columns=(0, 1), flip=False, cache=True,
+                cache_dir=None):
+    '''
+    Load a text spectrum with np.loadtxt and smooth it to resolving power R.
+
+    Results are memoized on disk, keyed by the sha1 of the file contents, R and the kernel, so repeated runs at the
+    same resolution skip both the text parse and the convolution. The cache sits next to the file unless cache_dir is
+    given.
+
+    Parameters
+    ----------
+    filename: str
+        Text file with the wavelength and spectrum in columns
+    R, kernel, samples_per_fwhm:
+        See smooth_to_resolution
+    columns: tuple
+        Wavelength and spectrum column numbers
+    flip: bool
+        Reverse the row order after loading, for files stored long to short wavelength
+    cache: bool
+        Memoize the result on disk
+    cache_dir: str, optional
+        Directory for the cached results
+
+    Returns
+    -------
+    wavelength, smoothed: arrays
+    '''
+    if cache:
+        digest = _cached_file_digest(filename, cache_dir=cache_dir)
+        tag = _resolution_tag(R, kernel, samples_per_fwhm)
+        cache_file = cache_path(filename, f'{digest[:16]}.{tag}.c{columns[0]}-{columns[1]}{".flip" if flip else ""}',
+                                 cache_dir=cache_dir)
+        if os.path.exists(cache_file):
+            count('smoothing.cache_hit')
+            cached = np.load(cache_file, mmap_mode='r')
+            return cached[:, 0], cached[:, 1]
+        count('smoothing.cache_miss')
+
+    data = np.loadtxt(filename, usecols=columns)
+    if flip:
+        data = np.flip(data, axis=0)
+    wavelength = data[:, 0]
+    smoothed = smooth_to_resolution(wavelength, data[:, 1], R, kernel=kernel, samples_per_fwhm=samples_per_fwhm)
+
+    if cache:
+        try:
+            np.save(cache_file + '.tmp.npy', np.column_stack((wavelength, smoothed)))
+            os.replace(cache_file + '.tmp.npy', cache_file)
+        except OSError:
+            pass
+
+    return wavelength, smoothed
+
+
+def _filter_chunk(source, out, start, stop, sigma, radius, mode, truncate):
+    from scipy.ndimage import gaussian_filter1d
+
+    # read the chunk with radius extra points on both sides, so every output point sees its whole kernel; at the
+    # ends of the array the boundary mode is applied exactly as for the whole array
+    lo = max(start - radius, 0)
+    hi = min(stop + radius, source.shape[0])
+    block = np.asarray(source[lo:hi])
+    smoothed = gaussian_filter1d(block, sigma, mode=mode, truncate=truncate, output=out.dtype)
+    out[start:stop] = smoothed[start - lo:stop - lo]
+
+
+def _chunk_R(R, wavelength, start, stop):
+    # R at wavelength[start:stop], evaluated as _resolution_coordinate does
+    if callable(R):
+        return np.asarray(R(np.exp(np.log(np.asarray(wavelength[start:stop], dtype=np.float64)))), dtype=np.float64)
+    return np.asarray(R[start:stop], dtype=np.float64)
+
+
+def _stretched_coordinate(wavelength, R, filename, chunk_size):
+    '''
+    The coordinate u and reference R0 of _resolution_coordinate for a varying R, built chunk by chunk into a
+    memory-mapped scratch file. The cumulative sum runs in the same order as for the whole array, so u is identical.
+    '''
+    n = wavelength.shape[0]
+    R0 = min(float(np.min(_chunk_R(R, wavelength, start, min(start + chunk_size, n))))
+             for start in range(0, n, chunk_size))
+
+    u = open_memmap(filename, mode='w+', dtype=np.float64, shape=(n,))
+    ln_wl0 = float(np.log(wavelength[0]))
+    total = 0.
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        lo = max(start - 1, 0)
+        ln_wl = np.log(np.asarray(wavelength[lo:stop], dtype=np.float64))
+        R_block = _chunk_R(R, wavelength, lo, stop)
+        du = 0.5*(R_block[1:] + R_block[:-1])/R0 * np.diff(ln_wl)
+        running = np.cumsum(np.concatenate(([total], du)))
+        u[start:stop] = (running if start == 0 else running[1:]) + ln_wl0
+        total = running[-1]
+    u.flush()
+    return u, R0
+
+
+def _median_diff(values, n, chunk_size):
+    '''
+    np.median(np.diff(x)) of a non-decreasing x of length n, read in chunks by values(start, stop) -> x[start:stop].
+
+    The two middle differences are selected exactly by narrowing a range of their bit patterns, which sort like the
+    values since the differences are not negative, with a histogram of 2^16 buckets per pass over x (4 passes each).
+    '''
+    m = n - 1
+    if m <= chunk_size:
+        return np.median(np.diff(values(0, n)))
+
+    def select(k):
+        # the k-th smallest difference, as its bit pattern
+        lo, hi = 0, 2**63 - 1
+        while lo < hi:
+            shift = max((hi - lo).bit_length() - 16, 0)
+            counts = np.zeros(((hi - lo) >> shift) + 1, dtype=np.int64)
+            below = 0
+            for start in range(0, m, chunk_size):
+                bits = np.diff(values(start, min(start + chunk_size, m) + 1)).view(np.int64)
+                below += np.count_nonzero(bits < lo)
+                inside = bits[(bits >= lo) & (bits <= hi)]
+                counts += np.bincount((inside - lo) >> shift, minlength=counts.size)
+            bucket = int(np.searchsorted(below + np.cumsum(counts), k + 1))
+            lo, hi = lo + (bucket << shift), min(lo + ((bucket + 1) << shift) - 1, hi)
+        return lo
+
+    middle = sorted({(m - 1)//2, m//2})
+    return np.mean(np.array([select(k) for k in middle], dtype=np.int64).view(np.float64)[[0, -1]])
+
+
+def _smooth_chunk(wavelength, spectrum, u, out, start, stop, R0, step, margin, kernel):
+    # extend the chunk by margin in u on both sides, plus one more input sample, so the grid points under every
+    # output point's kernel are interpolated from the same input samples as for the whole spectrum
+    n = wavelength.shape[0]
+    if u is None:
+        ends = np.log(np.asarray(wavelength[[start, stop - 1]], dtype=np.float64)) + np.array([-margin, margin])
+        lo, hi = np.searchsorted(wavelength, np.exp(ends))
+    else:
+        lo, hi = np.searchsorted(u, u[[start, stop - 1]] + np.array([-margin, margin]))
+    lo = max(min(lo - 1, start), 0)
+    hi = min(max(hi + 1, stop), n)
+
+    if u is None:
+        u_block = np.log(np.asarray(wavelength[lo:hi], dtype=np.float64))
+        u0 = float(np.log(wavelength[0]))
+    else:
+        u_block = np.asarray(u[lo:hi])
+        u0 = float(u[0])
+    smoothed = _convolve_on_grid(u_block, np.asarray(spectrum[lo:hi], dtype=np.float64), R0, step, u0, kernel)
+    out[start:stop] = smoothed[start - lo:stop - lo]
+
+
+def smooth_to_resolution_out_of_core(wavelength, spectrum, R, filename, chunk_size=2**22, kernel='gaussian',
+                                     samples_per_fwhm=4, max_workers=None):
+    '''
+    smooth_to_resolution of a spectrum too large for memory, in overlapping chunks.
+
+    Each chunk is smoothed with the kernel half width, on the internal grid, of extra samples on either side. All
+    chunks share the internal grid of the whole spectrum: ln(wavelength) for a constant R, and for a varying R the
+    stretched coordinate of smooth_to_resolution, which is built first into a scratch file next to filename. The
+    grid spacing is the median spacing of the whole spectrum, selected exactly in a few passes over the chunks, so
+    the result matches smooth_to_resolution of the whole spectrum to rounding (about 1e-15 on unit white noise).
+    Chunks run in parallel on a thread pool and are written straight into a memory-mapped .npy.
+
+    Parameters
+    ----------
+    wavelength, spectrum: arrays or str
+        Ascending wavelengths and the spectrum at them, typically memory-mapped (e.g. the columns of
+        open_cross_section(filename)), or the names of .npy files to memory-map
+    R: float, array or callable
+        As for smooth_to_resolution. An array must match wavelength, and may be memory-mapped too.
+    filename: str
+        Output .npy file
+    chunk_size: int
+        Output points per chunk
+    kernel, samples_per_fwhm:
+        As for smooth_to_resolution
+    max_workers: int, optional
+        Threads. Defaults to the number of cores.
+
+    Returns
+    -------
+    The smoothed spectrum, memory-mapped read-only from filename
+    '''
+    if isinstance(wavelength, (str, os.PathLike)):
+        wavelength = np.load(wavelength, mmap_mode='r')
+    if isinstance(spectrum, (str, os.PathLike)):
+        spectrum = np.load(spectrum, mmap_mode='r')
+    n = wavelength.shape[0]
+    if wavelength[0] > wavelength[n - 1]:
+        raise ValueError('smooth_to_resolution_out_of_core needs ascending wavelengths')
+
+    u_file = os.fspath(filename) + '.u.npy'
+    if callable(R) or np.ndim(R):
+        u, R0 = _stretched_coordinate(wavelength, R, u_file, chunk_size)
+    else:
+        u, R0 = None, float(R)
+    try:
+        # the median grid spacing, exactly as smooth_to_resolution finds it for the whole spectrum
+        if u is None:
+            spacing = _median_diff(lambda start, stop: np.log(np.asarray(wavelength[start:stop], dtype=np.float64)),
+                                   n, chunk_size)
+        else:
+            spacing = _median_diff(lambda start, stop: np.asarray(u[start:stop]), n, chunk_size)
+        step = min(spacing, 1/(R0*samples_per_fwhm))
+
+        out = open_memmap(filename, mode='w+', dtype=np.float64, shape=(n,))
+        starts = range(0, n, chunk_size)
+        stops = [min(start + chunk_size, n) for start in starts]
+        # the kernel half width and the grid point past it
+        margin = (_kernel(kernel, 1/(R0*step)).size//2 + 1)*step
+        smooth_chunk = partial(_smooth_chunk, wavelength, spectrum, u, out, R0=R0, step=step, margin=margin,
+                               kernel=kernel)
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+            # list() re-raises the first error of any chunk
+            list(pool.map(smooth_chunk, starts, stops))
+        out.flush()
+        del out, smooth_chunk
+    finally:
+        if u is not None:
+            del u
+            os.remove(u_file)
+    return np.load(filename, mmap_mode='r')
+
+
+def gaussian_filter_out_of_core(source, sigma, filename, chunk_size=2**22, mode='reflect', truncate=4.0,
+                                max_workers=None):
+    '''
+    scipy.ndimage.gaussian_filter of a 1D spectrum too large for memory, in overlapping chunks.
+
+    Each chunk is read with the kernel radius, int(truncate*sigma + 0.5), of extra points on either side (overlap-save),
+    so the result is identical to gaussian_filter of the whole array. Chunks are filtered in parallel on a thread pool
+    and written straight into a memory-mapped .npy; the working memory is about max_workers chunks.
+
+    sigma is fixed in samples, so on a grid evenly spaced in wavelength the FWHM is fixed in wavelength and the
+    resolving power grows with wavelength (by 70% over 1.47-2.5 um). It matches smooth_to_resolution only on a grid
+    evenly spaced in log-wavelength; otherwise use smooth_to_resolution_out_of_core.
+
+    Parameters
+    ----------
+    source: array or str
+        1D array, typically memory-mapped (e.g. a column of open_cross_section(filename) or np.load(..., mmap_mode='r')),
+        or the name of a .npy file to memory-map
+    sigma: float
+        Standard deviation of the gaussian, in samples
+    filename: str
+        Output .npy file
+    chunk_size: int
+        Output points per chunk
+    mode: str
+        Boundary mode of gaussian_filter. 'wrap' is not supported, since it needs both ends of the array at once.
+    truncate: float
+        Kernel half width in sigma, as for gaussian_filter
+    max_workers: int, optional
+        Threads. Defaults to the number of cores.
+
+    Returns
+    -------
+    The smoothed spectrum, memory-mapped read-only from filename. It has the dtype of source if that is floating
+    point, and float64 otherwise.
+    '''
+    if mode in ('wrap', 'grid-wrap'):
+        raise ValueError('gaussian_filter_out_of_core does not support wrap boundaries')
+    if isinstance(source, (str, os.PathLike)):
+        source = np.load(source, mmap_mode='r')
+    if source.ndim != 1:
+        raise ValueError('gaussian_filter_out_of_core filters 1D spectra; pass one column')
+
+    dtype = source.dtype if np.issubdtype(source.dtype, np.floating) else np.dtype(np.float64)
+    radius = int(truncate*float(sigma) + 0.5)
+    n = source.shape[0]
+    out = open_memmap(filename, mode='w+', dtype=dtype, shape=(n,))
+    starts = range(0, n, chunk_size)
+    stops = [min(start + chunk_size, n) for start in starts]
+    filter_chunk = partial(_filter_chunk, source, out, sigma=sigma, radius=radius, mode=mode, truncate=truncate)
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        # list() re-raises the first error of any chunk
+        list(pool.map(filter_chunk, starts, stops))
+    out.flush()
+    del out
+    return np.load(filename, mmap_mode='r')
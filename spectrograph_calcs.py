@@ -15,6 +15,8 @@ Immersion grating has a 60 mK stability requirement, to prevent instablility in
 
 import numpy as np
 
+from echelle import design_sweep, echelle_format, pixel_to_wavelength, wavelength_to_pixel
+
 D_gem = 8.1
 F_gem = 16
 D_super = 0.5
@@ -118,4 +120,45 @@ print(f'collimating optic: fp={f1_super: .1f}')
 
 
 
-
+def sweep_designs():
+    '''
+    Design-space sweep: the same formulas over grids of the design parameters, keeping the designs that fit a 2K x 2K
+    detector and clear the f1 fold mirror, and reporting the Pareto front of beam diameter vs resolution.
+    '''
+    designs, n_feasible = design_sweep(theta=np.radians(np.linspace(0.5, 3, 11)),
+                                       delta=np.radians(np.linspace(63.4, 76, 10)),
+                                       R=np.linspace(20000, 60000, 9),
+                                       D=np.array((D_super, D_giga)),
+                                       F=np.array((8, 10, 12)),
+                                       px_pitch=np.array((15e-6, 18e-6)),
+                                       grating_density=np.linspace(20, 60, 9),
+                                       objectives=(('d1', 'min'), ('R', 'max')),
+                                       min_fold_clearance=fold1_clearance)
+    print(f'{n_feasible} feasible designs, {designs.size} on the Pareto front')
+    # many designs share each (R, d1) point of the front; list what they span
+    for design in np.unique(designs[['R', 'd1']]):
+        tied = designs[(designs['R'] == design['R']) & (designs['d1'] == design['d1'])]
+        apertures = ', '.join(f'{d:g}' for d in np.unique(tied['D']))
+        focal_ratios = ', '.join(f'{f:g}' for f in np.unique(tied['F']))
+        print(f'R={design["R"]:.0f}: collimated beam {design["d1"]:.2f} mm, {tied.size} designs, '
+              f'D={apertures} m, F/{focal_ratios}, '
+              f'{tied["grating_density"].min():.0f}-{tied["grating_density"].max():.0f} lines/mm')
+
+
+def detector_format():
+    '''
+    Detector format of the hi-res design: where each wavelength of orders 72-122 lands on the detector
+    '''
+    hires_format = echelle_format(orders=hires_orders, delta=delta_hires, theta=theta, grating_density=grating_density,
+                                  n_grating=n_grating, f_camera=f2_super, px_pitch=px_pitch)
+    wavelengths = np.array((1.5, 2.0, 2.4))
+    order, x, y = wavelength_to_pixel(hires_format, wavelengths)
+    # the column mapping back to wavelength, which the detector simulation relies on
+    round_trip = pixel_to_wavelength(hires_format, order, x)
+    for wl, m, col, row, wl_back in zip(wavelengths, order, x, y, round_trip):
+        print(f'{wl} um: order {m}, column {col:.0f}, row {row:.0f}, back to {wl_back:.9f} um')
+
+
+if __name__ == '__main__':
+    sweep_designs()
+    detector_format()
@@ -9,10 +9,7 @@ by moving IGRINS to a balloon platform.
 
 For now, teat only water species
 """
-import matplotlib
-matplotlib.use("qt5agg")
 import numpy as np
-import matplotlib.pyplot as plt
 
 from toolkit import open_cross_section
 from transit_model import scale_h
@@ -29,20 +26,9 @@ wl_end = 2.5
 wn_end = 1e4/wl_start  # wavenumber start is reversed from wavelength start
 wn_start = 1e4/wl_end
 
-
-# generate a water spectrum
+# water cross sections at 30 mbar and 1500 K
 water_filename = './line_lists/H2O_30mbar_1500K.txt'
 
-wno_water, cross_sections_water = open_cross_section(water_filename, wn_range=(wn_start, wn_end))
-
-wl_water = 1e4/wno_water
-
-fig, ax = plt.subplots(figsize=(8,6))
-ax.plot(wl_water, cross_sections_water, label='H2O, 30 mb 1500 K')
-
-ax.set_xlabel('wavelength (um)')
-ax.set_ylabel('absorption cross-section')
-
 # partial fraction of water, according to Peter et al 2024
 log_f_h2o = -3.80  # log base 10
 
@@ -57,13 +43,30 @@ R_p = 1.21
 
 g_p = GM_j * M_p/R_p**2
 
-# smooth to R=40,000
+def main():
+    import matplotlib.pyplot as plt
 
+    # generate a water spectrum
+    wno_water, cross_sections_water = open_cross_section(water_filename, wn_range=(wn_start, wn_end))
+    # other conditions can be computed from a HITRAN line list instead, e.g. for 0.03 bar and 1500 K:
+    # from line_by_line import read_hitran_par, cross_section
+    # wno_water, cross_sections_water = cross_section(read_hitran_par('./line_lists/H2O.par', wn_range=(wn_start - 25, wn_end + 25)),
+    #                                                 np.arange(wn_start, wn_end, 0.01), 1500, 0.03, 18)
 
-# calculate cross correlation S/N
+    wl_water = 1e4/wno_water
 
+    fig, ax = plt.subplots(figsize=(8,6))
+    ax.plot(wl_water, cross_sections_water, label='H2O, 30 mb 1500 K')
 
+    ax.set_xlabel('wavelength (um)')
+    ax.set_ylabel('absorption cross-section')
 
+    # smooth to R=40,000
 
+    # calculate cross correlation S/N
 
 
+if __name__ == '__main__':
+    import matplotlib
+    matplotlib.use("qt5agg")
+    main()
@@ -0,0 +1,32 @@
+"""
+The echelle detector format: wavelength_to_pixel and pixel_to_wavelength are inverses on the detector.
+"""
+
+import numpy as np
+
+from echelle import echelle_format, order_trace, pixel_to_wavelength, trace_row, wavelength_to_pixel
+
+
+def test_wavelength_pixel_round_trip():
+    fmt = echelle_format()
+    wavelength = np.random.default_rng(0).uniform(1.45, 2.6, 10000)
+    order, x, y = wavelength_to_pixel(fmt, wavelength)
+    on_detector = order >= 0
+    assert np.count_nonzero(on_detector) > 0.5*wavelength.size
+
+    np.testing.assert_allclose(pixel_to_wavelength(fmt, order[on_detector], x[on_detector]),
+                               wavelength[on_detector], rtol=1e-12)
+    np.testing.assert_allclose(y[on_detector], trace_row(fmt, wavelength[on_detector]))
+    assert np.all(np.isnan(x[~on_detector]) & np.isnan(y[~on_detector]))
+
+
+def test_order_trace_round_trip():
+    fmt = echelle_format()
+    wavelength, _ = order_trace(fmt)
+    order, x, _ = wavelength_to_pixel(fmt, wavelength)
+    # columns inside each order's free spectral range map back to that order and column
+    in_range = (wavelength >= fmt.wl_start[:, None]) & (wavelength <= fmt.wl_end[:, None]) & (order >= 0)
+    assert np.any(in_range)
+    np.testing.assert_array_equal(order[in_range], np.broadcast_to(fmt.orders[:, None], order.shape)[in_range])
+    np.testing.assert_allclose(x[in_range], np.broadcast_to(np.arange(fmt.detector_px), x.shape)[in_range],
+                               atol=1e-6)
@@ -0,0 +1,41 @@
+"""
+render_spectrum against smooth_to_resolution of the sampled line spectrum.
+"""
+
+import numpy as np
+import pytest
+
+from line_spectrum import render_spectrum
+from smoothing import smooth_to_resolution
+
+
+@pytest.fixture
+def oh_like():
+    # 40 gaussian lines of R = 3e4, sampled at R = 2e5
+    rng = np.random.default_rng(0)
+    wavelength = np.arange(1.9, 2.1, 1e-5)
+    center = np.sort(rng.uniform(1.91, 2.09, 40))
+    sigma = center/3e4*0.4247
+    spectrum = np.sum(10**rng.uniform(0, 3, 40)[:, None]/(np.sqrt(2*np.pi)*sigma[:, None])
+                      * np.exp(-0.5*((wavelength - center[:, None])/sigma[:, None])**2), axis=0)
+    return wavelength, spectrum
+
+
+def test_clean_lines_are_rendered(oh_like):
+    wavelength, spectrum = oh_like
+    result = render_spectrum(wavelength, spectrum, 2500)
+    smoothed = smooth_to_resolution(wavelength, spectrum, 2500)
+    assert result.rendered
+    # the rendering leaves out the width of the lines themselves, (2500/3e4)^2 of the smoothed width
+    assert result.difference < 5e-3
+    assert np.max(np.abs(result.flux - smoothed)) <= result.difference*np.max(smoothed)*(1 + 1e-12)
+
+
+def test_noisy_lines_fall_back_to_smoothing(oh_like):
+    wavelength, spectrum = oh_like
+    noisy = spectrum + 0.1*spectrum.max()*np.random.default_rng(1).standard_normal(wavelength.size)
+    smoothed = smooth_to_resolution(wavelength, noisy, 2500)
+    result = render_spectrum(wavelength, noisy, 2500, reference=smoothed)
+    assert not result.rendered
+    assert result.difference > 1e-2
+    np.testing.assert_array_equal(result.flux, smoothed)
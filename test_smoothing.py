@@ -0,0 +1,38 @@
+"""
+The out-of-core smoothers against their in-memory versions, at a chunk size that does not divide the spectrum.
+"""
+
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter
+
+from smoothing import gaussian_filter_out_of_core, smooth_to_resolution, smooth_to_resolution_out_of_core
+
+n = 20011
+chunk_size = 997
+
+
+@pytest.fixture
+def white_noise():
+    rng = np.random.default_rng(0)
+    wavelength = np.sort(rng.uniform(1.45, 2.6, n))
+    return wavelength, rng.standard_normal(n)
+
+
+@pytest.mark.parametrize('mode', ['reflect', 'nearest', 'mirror', 'constant'])
+def test_gaussian_filter_out_of_core(tmp_path, white_noise, mode):
+    _, spectrum = white_noise
+    smoothed = gaussian_filter_out_of_core(spectrum, 7.3, tmp_path/'smoothed.npy', chunk_size=chunk_size, mode=mode)
+    np.testing.assert_array_equal(smoothed, gaussian_filter(spectrum, 7.3, mode=mode))
+
+
+@pytest.mark.parametrize('R', [3000., 1e6, lambda wavelength: 2000 + 1000*wavelength, 'array'])
+def test_smooth_to_resolution_out_of_core(tmp_path, white_noise, R):
+    # R = 1e6 puts the internal grid spacing on the input sampling instead of the kernel
+    wavelength, spectrum = white_noise
+    if isinstance(R, str):
+        R = 3000 + 500*np.sin(np.linspace(0, 3, n))
+    smoothed = smooth_to_resolution_out_of_core(wavelength, spectrum, R, tmp_path/'smoothed.npy',
+                                                chunk_size=chunk_size)
+    np.testing.assert_allclose(smoothed, smooth_to_resolution(wavelength, spectrum, R), rtol=0, atol=1e-12)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['smoothed.npy']
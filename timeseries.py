@@ -0,0 +1,123 @@
+"""
+Exposure sequences of a transiting planet, generated a few exposures at a time.
+
+Every exposure is star * telluric * (1 + contrast * planet shifted to v = v_sys + K_p sin(2 pi phase)), on a grid
+uniform in log-wavelength (cross_correlation.log_wavelength_grid). On that grid a Doppler shift is the same
+fractional pixel shift at every wavelength, so doppler_weights reduces each exposure to an integer offset and one
+interpolation weight, and shifting is two slices of a padded planet spectrum instead of an np.interp per exposure.
+The exposures are yielded in (chunk_size, n_pixels) blocks, so a full transit at R=40000 never exists as one array;
+write_series streams the blocks into a memory-mapped .npy.
+
+Velocities are in m/s and times in seconds.
+"""
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from radiometry import c
+
+
+def exposure_phases(phase_start, phase_end, exposure_time, t_orbit):
+    '''
+    Orbital phase at the middle of each exposure, for back-to-back exposures from phase_start to phase_end.
+
+    exposure_time is typically orbits.delta_t_max, so the planet lines move less than half a resolution element
+    during an exposure.
+    '''
+    step = exposure_time/t_orbit
+    n = int(np.floor((phase_end - phase_start)/step))
+    return phase_start + step*(np.arange(n) + 0.5)
+
+
+def doppler_weights(log_grid, velocities):
+    '''
+    Linear interpolation weights of a Doppler shift on a log-wavelength grid.
+
+    Shifting by v samples the rest frame spectrum at wl/(1 + v/c), which is pixel i - ln(1 + v/c)/step on the grid.
+
+    Returns
+    -------
+    offset: int array
+        Integer part of the pixel shift of each velocity
+    weight: float array
+        Fractional part, the weight of the pixel after the integer shift
+    '''
+    step = np.log(log_grid[-1]/log_grid[0])/(log_grid.size - 1)
+    position = -np.log1p(np.asarray(velocities, dtype=np.float64)/c)/step
+    offset = np.floor(position).astype(np.intp)
+    return offset, position - offset
+
+
+def transit_series(log_grid, star, telluric, planet, phases, kp, vsys, contrast, snr=None, chunk_size=16,
+                   dtype=np.float32, rng=None):
+    '''
+    Simulated exposures of a planet spectrum moving across a star and telluric spectrum, in chunks.
+
+    Parameters
+    ----------
+    log_grid: array
+        Log-wavelength grid, from cross_correlation.log_wavelength_grid
+    star, telluric, planet: arrays
+        Stellar continuum, telluric transmission and planet spectrum on log_grid. planet is normalized to a continuum
+        of 1; its line depths set the signal.
+    phases: array
+        Orbital phase of each exposure, e.g. from exposure_phases
+    kp, vsys: float
+        Planet orbital and systemic velocity
+    contrast: float
+        Planet to star flux ratio in the continuum
+    snr: float, optional
+        S/N per pixel of the star in the continuum, in each exposure. If not given, the exposures are noiseless.
+    chunk_size: int
+        Number of exposures per block
+    dtype: dtype
+        Of the blocks
+    rng: np.random.Generator, optional
+
+    Yields
+    ------
+    start: int
+        Index of the first exposure of the block
+    block: array
+        (n, n_pixels) exposures, with n = chunk_size except for the last block. The block is a new array each time.
+    '''
+    rng = np.random.default_rng(rng)
+    phases = np.asarray(phases, dtype=np.float64)
+    offset, weight = doppler_weights(log_grid, vsys + kp*np.sin(2*np.pi*phases))
+
+    # pad with the edge values, like np.interp, so every shifted slice stays inside the array
+    pad = int(np.max(np.abs(offset))) + 1
+    padded = np.pad(np.asarray(planet, dtype=np.float64), pad, mode='edge')
+    n_pix = log_grid.size
+    window = np.arange(n_pix)
+    stationary = np.asarray(star, dtype=np.float64)*np.asarray(telluric, dtype=np.float64)
+    if snr is not None:
+        star_max = np.max(star)
+        noise_sigma = np.sqrt(np.maximum(stationary, 0)/star_max)*star_max/snr
+
+    for start in range(0, phases.size, chunk_size):
+        stop = min(start + chunk_size, phases.size)
+        left = window[None, :] + pad + offset[start:stop, None]
+        w = weight[start:stop, None]
+        shifted = (1 - w)*padded[left] + w*padded[left + 1]
+        block = stationary*(1 + contrast*shifted)
+        if snr is not None:
+            block += rng.standard_normal(block.shape)*noise_sigma
+        block = block.astype(dtype, copy=False)
+        yield start, block
+
+
+def write_series(filename, series, n_exposures, n_pixels, dtype=np.float32):
+    '''
+    Stream the blocks of transit_series into a memory-mapped (n_exposures, n_pixels) .npy file.
+
+    Returns
+    -------
+    The memory-mapped array, opened read-only
+    '''
+    out = open_memmap(filename, mode='w+', dtype=dtype, shape=(n_exposures, n_pixels))
+    for start, block in series:
+        out[start:start + len(block)] = block
+    out.flush()
+    del out
+    return np.load(filename, mmap_mode='r')
@@ -1,30 +1,291 @@
 import numpy as np
 import warnings
+import os
+import json
+import hashlib
+from collections import namedtuple
+from numpy.lib.format import open_memmap
 
-def open_cross_section(filename, wn_range=None, verbose=False, skiplines=None):
+
+def cache_path(filename, tag, cache_dir=None, ext='.npy'):
+    '''
+    Path of a cached binary copy of filename, {basename}.{tag}{ext}.
+
+    Cached copies live next to the source file unless a cache directory is given, which is created if needed.
+    '''
+    directory, basename = os.path.split(os.path.abspath(filename))
+    if cache_dir is not None:
+        directory = cache_dir
+        os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f'{basename}.{tag}{ext}')
+
+
+def source_stamp(filename):
+    '''
+    Size and mtime of a source file, as a dict. A change in either invalidates any cached copy of it.
+    '''
+    stat = os.stat(filename)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def array_digest(*arrays):
+    '''
+    sha1 hex digest of the shapes and float64 contents of arrays, for keying caches of computed results.
+    '''
+    digest = hashlib.sha1()
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr, dtype=np.float64)
+        digest.update(str(arr.shape).encode())
+        digest.update(arr.data)
+    return digest.hexdigest()
+
+
+def _iter_cross_section_text(filename, skiplines=None, verbose=False, chunk_size=2**24, skip_below=None):
+    '''
+    Parse a cross section text file in chunks of about chunk_size characters.
+
+    Yields (data, truncated) pairs, where data is an (n, 2) array of the rows in the chunk and truncated is True if the
+    read in stopped at an empty line. If skip_below is given, chunks that lie entirely below that wavenumber are not
+    parsed; only their last row (with any rows repeating its wavenumber) is yielded, so the nearest-point behaviour of
+    the slicers is kept.
+    '''
     with open(filename) as file:
         if skiplines:
             if verbose: print('skiping %d lines' % skiplines)
-            raw_data = file.readlines()[skiplines:]
-        else:
-            raw_data = file.readlines()
-
-        wave_numbers = []
-        cross_sections = []
+            for _ in range(skiplines):
+                file.readline()
 
         if verbose:
             print('raw')
 
-        for x in raw_data:
-            if x == '\n':
-                warnings.warn('Cross section read in terminated early due to empty line!', UserWarning)
-                break
+        remainder = ''
+        while True:
+            block = file.read(chunk_size)
+            text = remainder + block
+            if block:
+                # only parse whole lines; carry the partial last line into the next chunk
+                cut = text.rfind('\n') + 1
+                text, remainder = text[:cut], text[cut:]
+            elif not text:
+                return
             else:
-                wave_string, cross_string = x.split()
-                wave_numbers.append(float(wave_string))
-                cross_sections.append(float(cross_string))
-        wave_numbers = np.array(wave_numbers)
-        cross_sections = np.array(cross_sections)
+                remainder = ''
+
+            # read in stops at the first empty line
+            truncated = text.startswith('\n') or '\n\n' in text
+            if truncated:
+                text = '' if text.startswith('\n') else text[:text.index('\n\n') + 1]
+
+            if skip_below is not None and text and not truncated:
+                tail, last_value = _equal_tail(text)
+                if last_value < skip_below:
+                    yield _parse_cross_section_lines(filename, tail), False
+                    continue
+
+            yield _parse_cross_section_lines(filename, text), truncated
+            if truncated or not block:
+                return
+
+
+def _parse_cross_section_lines(filename, text):
+    data = np.fromstring(text, sep=' ')
+    if data.size != 2*(text.count('\n') + (not text.endswith('\n') and bool(text))):
+        raise ValueError(f'{filename}: expected two columns (wavenumber, cross section) on every line')
+
+    return data.reshape(-1, 2)
+
+
+def _parse_cross_section_text(filename, skiplines=None, verbose=False, chunk_size=2**24):
+    chunks = []
+    truncated = False
+    for data, truncated in _iter_cross_section_text(filename, skiplines=skiplines, verbose=verbose,
+                                                     chunk_size=chunk_size):
+        chunks.append(data)
+
+    return np.concatenate(chunks) if chunks else np.empty((0, 2)), truncated
+
+
+def _equal_tail(text):
+    # the last line of a block of lines, together with the lines before it that repeat its wavenumber
+    end = len(text) - 1 if text.endswith('\n') else len(text)
+    start = text.rfind('\n', 0, end) + 1
+    value = float(text[start:end].split()[0])
+    while start > 0:
+        previous = text.rfind('\n', 0, start - 1) + 1
+        if float(text[previous:start].split()[0]) != value:
+            break
+        start = previous
+    return text[start:], value
+
+
+def _first_wavenumbers(filename, skiplines=None, n=2):
+    # wavenumbers of the first n rows, to check the sort order of a file without parsing it
+    values = []
+    with open(filename) as file:
+        for _ in range(skiplines or 0):
+            file.readline()
+        for line in file:
+            if not line.strip() or len(values) == n:
+                break
+            values.append(float(line.split()[0]))
+    return values
+
+
+def _stream_cross_section_window(filename, wn_start, wn_end, skiplines=None, verbose=False, chunk_size=2**24):
+    '''
+    Read only the rows needed to slice (wn_start, wn_end) out of a cross section file sorted by wavenumber.
+
+    Keeps the last row below wn_start (with all rows repeating its wavenumber, since the slicers take the first of
+    equal points) and stops reading at the first row above wn_end, so slicing the window with spectrum_slicer_old
+    gives the same result as slicing the whole file. The file must be sorted by ascending wavenumber.
+    '''
+    first_values = _first_wavenumbers(filename, skiplines=skiplines)
+    if len(first_values) == 2 and first_values[0] > first_values[1]:
+        raise ValueError(f'{filename} is sorted by descending wavenumber; stream=True needs ascending wavenumbers, '
+                         'read it with stream=False instead')
+
+    window = []
+    for data, truncated in _iter_cross_section_text(filename, skiplines=skiplines, verbose=verbose,
+                                                     chunk_size=chunk_size, skip_below=wn_start):
+        if truncated:
+            warnings.warn('Cross section read in terminated early due to empty line!', UserWarning)
+
+        wave_numbers = data[:, 0]
+        first = np.searchsorted(wave_numbers, wn_start)
+        past = np.searchsorted(wave_numbers, wn_end, side='right')
+        if first:
+            # the file is sorted, so everything before the last value below wn_start can go, except the repeats of
+            # that value, which may continue from the previous chunk
+            below = wave_numbers[first - 1]
+            keep_from = np.searchsorted(wave_numbers, below)
+            carried = []
+            if keep_from == 0 and window:
+                previous = np.concatenate(window)
+                carried = [previous[previous[:, 0] == below]]
+            window = carried + [data[keep_from:past + 1]]
+        else:
+            window.append(data[:past + 1])
+        if past < data.shape[0]:
+            break
+
+    window = np.concatenate(window) if window else np.empty((0, 2))
+    return spectrum_slicer_old(wn_start, wn_end, window[:, 0], window[:, 1])
+
+
+def _convert_cross_section_text(filename, npy_file, skiplines=None, verbose=False, block_rows=2**22):
+    '''
+    Convert a cross section text file to a (n, 2) float64 .npy file, without holding the whole file in memory.
+
+    The parsed chunks are appended to a raw temporary file, since the number of rows is only known at the end, and
+    then copied block by block into the .npy. Both go to temporary names first, so an interrupted conversion never
+    leaves a valid looking cache. Returns True if the read in stopped at an empty line.
+    '''
+    raw_file = npy_file + '.tmp.bin'
+    n_rows = 0
+    truncated = False
+    try:
+        with open(raw_file, 'wb') as raw:
+            for data, truncated in _iter_cross_section_text(filename, skiplines=skiplines, verbose=verbose):
+                np.ascontiguousarray(data, dtype=np.float64).tofile(raw)
+                n_rows += data.shape[0]
+
+        out = open_memmap(npy_file + '.tmp.npy', mode='w+', dtype=np.float64, shape=(n_rows, 2))
+        if n_rows:
+            rows = np.memmap(raw_file, dtype=np.float64, mode='r', shape=(n_rows, 2))
+            for start in range(0, n_rows, block_rows):
+                out[start:start + block_rows] = rows[start:start + block_rows]
+            del rows
+        out.flush()
+        del out
+        os.replace(npy_file + '.tmp.npy', npy_file)
+    finally:
+        if os.path.exists(raw_file):
+            os.remove(raw_file)
+    return truncated
+
+
+def _load_cross_section_cache(filename, skiplines=None, verbose=False, cache_dir=None):
+    '''
+    Memory-map the binary copy of a cross section file, converting the text file first if needed.
+
+    The binary copy is a (n, 2) float64 .npy file with a small json sidecar recording the size and mtime of the source
+    file. If the source has changed since the conversion, the copy is rebuilt.
+    '''
+    npy_file = cache_path(filename, f'skip{skiplines or 0}', cache_dir=cache_dir)
+    meta_file = npy_file[:-len('.npy')] + '.json'
+    stamp = source_stamp(filename)
+
+    try:
+        with open(meta_file) as file:
+            meta = json.load(file)
+        if meta['source'] == stamp and os.path.exists(npy_file):
+            if verbose: print('reading cached cross sections from %s' % npy_file)
+            if meta['truncated']:
+                warnings.warn('Cross section read in terminated early due to empty line!', UserWarning)
+            return np.load(npy_file, mmap_mode='c')
+    except (OSError, ValueError, KeyError):
+        pass
+
+    try:
+        truncated = _convert_cross_section_text(filename, npy_file, skiplines=skiplines, verbose=verbose)
+        with open(meta_file, 'w') as file:
+            json.dump({'source': stamp, 'truncated': truncated}, file)
+    except OSError as err:
+        warnings.warn(f'Could not write cross section cache {npy_file}: {err}', UserWarning)
+        data, truncated = _parse_cross_section_text(filename, skiplines=skiplines, verbose=verbose)
+        if truncated:
+            warnings.warn('Cross section read in terminated early due to empty line!', UserWarning)
+        return data
+
+    if truncated:
+        warnings.warn('Cross section read in terminated early due to empty line!', UserWarning)
+    if verbose: print('cached cross sections to %s' % npy_file)
+    return np.load(npy_file, mmap_mode='c')
+
+
+def open_cross_section(filename, wn_range=None, verbose=False, skiplines=None, cache=True, cache_dir=None,
+                       stream=False, chunk_size=2**24):
+    '''
+    Read a two column (wavenumber, cross section) text file.
+
+    Parameters
+    ----------
+    filename: str
+        Path to the cross section text file
+    wn_range: tuple, optional
+        (wn_start, wn_end) to slice the result to
+    verbose: bool
+    skiplines: int, optional
+        Number of header lines to skip
+    cache: bool
+        If True, the text file is converted once to a binary .npy copy, and later reads memory-map that copy. The
+        copy is rebuilt whenever the size or mtime of the text file changes.
+    cache_dir: str, optional
+        Directory for the binary copy. Defaults to the directory of the text file.
+    stream: bool
+        If True, and wn_range is given, read the text file in chunks, skipping chunks below wn_start and stopping after
+        wn_end. Peak memory then scales with the size of the window instead of the file. Bypasses the cache.
+    chunk_size: int
+        Approximate number of characters parsed at a time
+
+    Returns
+    -------
+    wave_numbers, cross_sections: arrays
+    '''
+    if stream and wn_range is not None:
+        wn_start, wn_end = wn_range
+        return _stream_cross_section_window(filename, wn_start, wn_end, skiplines=skiplines, verbose=verbose,
+                                            chunk_size=chunk_size)
+
+    if cache:
+        data = _load_cross_section_cache(filename, skiplines=skiplines, verbose=verbose, cache_dir=cache_dir)
+    else:
+        data, truncated = _parse_cross_section_text(filename, skiplines=skiplines, verbose=verbose,
+                                                    chunk_size=chunk_size)
+        if truncated:
+            warnings.warn('Cross section read in terminated early due to empty line!', UserWarning)
+    wave_numbers = data[:, 0]
+    cross_sections = data[:, 1]
 
     if wn_range is None:
         return wave_numbers, cross_sections
@@ -35,15 +296,312 @@ def open_cross_section(filename, wn_range=None, verbose=False, skiplines=None):
         return spectrum_slicer_old(wn_start, wn_end, wave_numbers, cross_sections)
 
 
+
 def snr_calculator(snr_ref, t, r_new, contrast, n_lines, r_ref, t_ref=120):
     # snr_cc = snr_gem * np.sqrt(exposure_time/120) * R_gem/R_gem * planet_contrast * np.sqrt(N_lines)
     return snr_ref * np.sqrt(t/t_ref) * r_new/r_ref * contrast * np.sqrt(n_lines)
 
 
-def spectrum_slicer_old(start_angstrom, end_angstrom, angstrom_data, spectrum_data):
+LineIndex = namedtuple('LineIndex', ['wavelength', 'depth_sum', 'depth_sq_sum'])
+
+
+def build_line_index(wavelength, transmission):
+    '''
+    Precompute running sums of the line depth (1-T) and (1-T)^2 of a transmission spectrum.
+
+    With the index, the line depth sum over any band is two binary searches and a subtraction, see n_lines.
+
+    Parameters
+    ----------
+    wavelength: array
+        Wavelengths of the spectrum, ascending or descending
+    transmission: array
+        Transmission spectrum, usually already smoothed to the instrument resolution
+
+    Returns
+    -------
+    LineIndex
+        namedtuple of (wavelength, depth_sum, depth_sq_sum), with the wavelengths ascending and the running sums
+        starting at 0, so they have one more entry than wavelength
+    '''
+    wavelength = np.asarray(wavelength, dtype=np.float64)
+    depth = 1 - np.asarray(transmission, dtype=np.float64)
+    if wavelength[0] > wavelength[-1]:
+        wavelength = wavelength[::-1]
+        depth = depth[::-1]
 
-    start_index = (np.abs(angstrom_data - start_angstrom)).argmin()
-    end_index = (np.abs(angstrom_data - end_angstrom)).argmin()
+    depth_sum = np.concatenate(([0.], np.cumsum(depth)))
+    depth_sq_sum = np.concatenate(([0.], np.cumsum(depth**2)))
+    return LineIndex(np.ascontiguousarray(wavelength), depth_sum, depth_sq_sum)
+
+
+def n_lines(index, windows, power=2):
+    '''
+    Sum of the line depth over one or more bands, from a LineIndex.
+
+    Matches np.sum((1-T)[(wl > start) * (wl < end)]**power) for each band, without a pass over the spectrum.
+
+    Parameters
+    ----------
+    index: LineIndex
+        From build_line_index
+    windows: array
+        (start, end) of one band, or an (..., 2) array of bands
+    power: int
+        1 for the sum of (1-T), 2 for the sum of (1-T)^2
+
+    Returns
+    -------
+    The line depth sum of each band, with the shape of windows minus the last axis. To combine disjoint bands (e.g.
+    the IGRINS H and K windows), sum the result over the bands.
+    '''
+    if power not in (1, 2):
+        raise ValueError('power must be 1 or 2')
+    running_sum = index.depth_sum if power == 1 else index.depth_sq_sum
+
+    windows = np.asarray(windows, dtype=np.float64)
+    lo = np.searchsorted(index.wavelength, windows[..., 0], side='right')
+    hi = np.searchsorted(index.wavelength, windows[..., 1], side='left')
+    total = running_sum[np.maximum(hi, lo)] - running_sum[lo]
+
+    return total if total.ndim else float(total)
+
+
+def save_line_index(filename, index):
+    # stored as an .npz, alongside the smoothed spectrum it was built from
+    np.savez(filename, **index._asdict())
+
+
+def load_line_index(filename):
+    with np.load(filename) as data:
+        return LineIndex(*(data[field] for field in LineIndex._fields))
+
+
+SweepResult = namedtuple('SweepResult', ['values', 'dims', 'coords'])
+
+
+def _sweep_axis(arg):
+    # scalars have no dimensions; sweep axes are given as (dims, values)
+    if isinstance(arg, tuple) and len(arg) == 2:
+        dims, values = arg
+        dims = (dims,) if isinstance(dims, str) else tuple(dims)
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim != len(dims):
+            raise ValueError(f'{len(dims)} dimension names {dims} given for a {values.ndim}D array')
+        return dims, values
+    return (), np.asarray(arg, dtype=np.float64)
+
+
+def snr_sweep(snr_ref, r_ref, aperture_radius, exposure_time, contrast, n_lines, t_ref=120, coords=None,
+              chunk_size=None, out=None):
+    '''
+    Evaluate snr_calculator over a grid of scenarios in one vectorized pass.
+
+    Each of aperture_radius, exposure_time, contrast and n_lines is either a scalar, or a (dims, values) pair where dims
+    names the axes of values. Axes that share a name are the same axis, so e.g. n_lines can be a table over
+    ('resolution', 'band') while aperture_radius runs over ('platform',). The result has one axis per distinct name, in
+    order of first appearance.
+
+    Parameters
+    ----------
+    snr_ref: float
+        S/N of the host star per bin in the reference exposure
+    r_ref: float
+        Aperture radius of the reference telescope
+    aperture_radius, exposure_time, contrast, n_lines: float or (dims, array)
+        Same meaning as the r_new, t, contrast and n_lines arguments of snr_calculator
+    t_ref: float
+        Reference exposure time, in seconds
+    coords: dict, optional
+        Labels for each axis, e.g. {'platform': ['Gemini', 'Superbit', 'Gigabit']}. Axes without labels get integer
+        positions.
+    chunk_size: int, optional
+        Number of entries along the first axis evaluated at a time, to bound the size of the temporaries
+    out: array, optional
+        Preallocated output (e.g. a np.memmap) with the shape of the result
+
+    Returns
+    -------
+    SweepResult
+        namedtuple of (values, dims, coords)
+    '''
+    args = [_sweep_axis(arg) for arg in (aperture_radius, exposure_time, contrast, n_lines)]
+
+    dims = []
+    sizes = {}
+    for arg_dims, values in args:
+        for dim, size in zip(arg_dims, values.shape):
+            if sizes.setdefault(dim, size) != size:
+                raise ValueError(f'axis {dim} has inconsistent lengths {sizes[dim]} and {size}')
+            if dim not in dims:
+                dims.append(dim)
+    shape = tuple(sizes[dim] for dim in dims)
+
+    # move every argument onto the full set of axes, with length 1 along the axes it doesn't use
+    expanded = []
+    for arg_dims, values in args:
+        if arg_dims:
+            order = sorted(range(len(arg_dims)), key=lambda i: dims.index(arg_dims[i]))
+            values = np.transpose(values, order)
+            values = values.reshape([sizes[dim] if dim in arg_dims else 1 for dim in dims])
+        expanded.append(values)
+
+    if out is None:
+        out = np.empty(shape)
+    elif out.shape != shape:
+        raise ValueError(f'out has shape {out.shape}, the sweep has shape {shape}')
+
+    if not dims or chunk_size is None:
+        out[...] = snr_calculator(snr_ref, expanded[1], expanded[0], expanded[2], expanded[3], r_ref, t_ref=t_ref)
+    else:
+        for start in range(0, shape[0], chunk_size):
+            chunk = [values[start:start + chunk_size] if values.ndim and values.shape[0] > 1 else values
+                     for values in expanded]
+            out[start:start + chunk_size] = snr_calculator(snr_ref, chunk[1], chunk[0], chunk[2], chunk[3], r_ref,
+                                                           t_ref=t_ref)
+
+    coords = dict(coords or {})
+    coords = {dim: np.asarray(coords[dim]) if dim in coords else np.arange(sizes[dim]) for dim in dims}
+    return SweepResult(out, tuple(dims), coords)
+
+
+def sweep_to_xarray(result, name='snr_cc'):
+    '''
+    Convert a SweepResult to an xarray.DataArray. Requires xarray.
+    '''
+    import xarray
+
+    return xarray.DataArray(result.values, dims=result.dims, coords=result.coords, name=name)
+
+
+def _bisect_sorted(grid, values, descending=False):
+    # vectorized binary search that works on strided views (e.g. dataset[:, 0] or arr[::-1]) without copying them
+    if values.size == 1:
+        # a scalar lookup is ~log2(n) element reads; a plain loop avoids a dozen array operations per step
+        x = values.item()
+        lo, hi = 0, grid.shape[0]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (grid[mid] > x) if descending else (grid[mid] < x):
+                lo = mid + 1
+            else:
+                hi = mid
+        return np.full(values.shape, lo, dtype=np.intp)
+
+    lo = np.zeros(values.shape, dtype=np.intp)
+    hi = np.full(values.shape, grid.shape[0], dtype=np.intp)
+    while np.any(lo < hi):
+        mid = (lo + hi) // 2
+        mid_values = grid[np.minimum(mid, grid.shape[0] - 1)]
+        before = (mid_values > values) if descending else (mid_values < values)
+        before &= lo < hi
+        lo = np.where(before, mid + 1, lo)
+        hi = np.where(before | (lo >= hi), hi, mid)
+    return lo
+
+
+def nearest_index(grid, values):
+    '''
+    Index of the grid point nearest to each value, for a sorted grid.
+
+    Gives the same result as np.abs(grid - value).argmin(), but with a binary search, so each lookup is O(log n) and no
+    temporary array the size of the grid is made. The grid can be ascending (wavenumber) or descending (wavelength).
+
+    Parameters
+    ----------
+    grid: array
+        1D sorted array
+    values: float, array
+        Values to look up
+
+    Returns
+    -------
+    index: int, array
+        Same shape as values
+    '''
+    grid = np.asarray(grid)
+    values = np.asarray(values)
+    if grid.shape[0] == 0:
+        raise ValueError('cannot find the nearest point of an empty grid')
+
+    descending = grid[0] > grid[-1]
+
+    def insertion_index(x):
+        if not descending and grid.flags.c_contiguous:
+            return np.searchsorted(grid, x)
+        return _bisect_sorted(grid, np.atleast_1d(x), descending=descending).reshape(x.shape)
+
+    # the nearest point is either side of the insertion point; ties go to the lower index, like argmin
+    index = insertion_index(values)
+    below = np.clip(index - 1, 0, grid.shape[0] - 1)
+    above = np.clip(index, 0, grid.shape[0] - 1)
+    use_below = np.abs(grid[below] - values) <= np.abs(grid[above] - values)
+    # step back to the first of any repeated grid values
+    index = insertion_index(grid[np.where(use_below, below, above)])
+
+    return index if index.ndim else int(index)
+
+
+def window_indices(grid, starts, ends, inclusive=False):
+    '''
+    Start and stop indices of many (start, end) windows on a sorted grid, in one vectorized call.
+
+    The windows follow the slicer convention: each endpoint snaps to its nearest grid point, and the end point is
+    excluded unless inclusive is True.
+
+    Returns
+    -------
+    start_index, stop_index: arrays
+        grid[start_index[i]:stop_index[i]] is window i
+    '''
+    start_index = np.atleast_1d(nearest_index(grid, starts))
+    stop_index = np.atleast_1d(nearest_index(grid, ends)) + int(inclusive)
+    return start_index, stop_index
+
+
+def slice_windows(grid, windows, *arrays, inclusive=False):
+    '''
+    Slice a sorted grid, and any arrays sampled on it, into many windows.
+
+    Parameters
+    ----------
+    grid: array
+        1D sorted array
+    windows: array
+        (n_windows, 2) array of (start, end) values
+    arrays: arrays
+        Arrays whose first axis matches the grid
+    inclusive: bool
+        Include the end point of each window
+
+    Returns
+    -------
+    A list with one tuple per window, (grid_slice, *array_slices). The slices are views, nothing is copied.
+    '''
+    windows = np.asarray(windows)
+    start_index, stop_index = window_indices(grid, windows[..., 0], windows[..., 1], inclusive=inclusive)
+    return [tuple(arr[start:stop] for arr in (grid,) + arrays) for start, stop in zip(start_index, stop_index)]
+
+
+def interpolation_weights(axis, values, name='value'):
+    '''
+    Index of the lower grid point and the weight of the upper one, for linear interpolation along an ascending axis.
+
+    Raises a ValueError if any value is outside the axis.
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    if np.any(values < axis[0]) or np.any(values > axis[-1]):
+        raise ValueError(f'{name} outside the grid range {axis[0]:g} to {axis[-1]:g}')
+    if axis.size == 1:
+        return np.zeros(values.shape, dtype=np.intp), np.zeros(values.shape)
+    lower = np.clip(np.searchsorted(axis, values, side='right') - 1, 0, axis.size - 2)
+    return lower, (values - axis[lower])/(axis[lower + 1] - axis[lower])
+
+
+def spectrum_slicer_old(start_angstrom, end_angstrom, angstrom_data, spectrum_data):
+    # angstrom_data must be sorted, either ascending or descending
+    start_index = nearest_index(angstrom_data, start_angstrom)
+    end_index = nearest_index(angstrom_data, end_angstrom)
     spectrum_slice = spectrum_data[start_index:end_index]
     angstrom_slice = angstrom_data[start_index:end_index]
 
@@ -51,10 +609,8 @@ def spectrum_slicer_old(start_angstrom, end_angstrom, angstrom_data, spectrum_da
 
 
 def spectrum_slicer(start_angstrom, end_angstrom, dataset):
-
-    start_index = (np.abs(dataset[:, 0] - start_angstrom)).argmin()
-    end_index = (np.abs(dataset[:, 0] - end_angstrom)).argmin()
+    # the first column of dataset must be sorted, either ascending or descending
+    start_index = nearest_index(dataset[:, 0], start_angstrom)
+    end_index = nearest_index(dataset[:, 0], end_angstrom)
 
     return dataset[start_index:end_index+1]
-
-
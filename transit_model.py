@@ -122,5 +122,70 @@ def z_lambda(sigma_trace, xi, p0, planet_radius, mass, T, g, sigma_filler=None):
     return h * np.log(sigma * 1/np.sqrt(k*mass*amu_kg*T*g) * beta)
 
 
+def z_lambda_batch(sigma_trace, xi, p0, planet_radius, mass, T, g, sigma_filler=None, chunk_size=None, out=None):
+    '''
+    Batched form of z_lambda, for many atmospheres at once.
 
+    The species are mixed with a single matrix product, xi @ sigma_trace, and the rest of the calculation is done in
+    place on the (n_models, n_wavelength) block.
 
+    Parameters
+    ----------
+    sigma_trace: array
+        (n_species, n_wavelength) absorption cross-sections of the atmosphere species
+    xi: array
+        (n_models, n_species) abundance of each species in each model
+    p0: float, array
+        Reference pressure of atmosphere, in bars. Scalar or (n_models,)
+    planet_radius: float, array
+        Minimum radius of planet, in Jupiter radii. Scalar or (n_models,)
+    mass: float, array
+        Mean molecular mass, in amu. Scalar or (n_models,)
+    T: float, array
+        Effective temperature of planet. Scalar or (n_models,)
+    g: float, array
+        Gravity of the planet, in m/s^2. Scalar or (n_models,)
+    sigma_filler: float, array
+        Cross-section of the filler gas. Scalar or (n_wavelength,)
+    chunk_size: int
+        Number of models computed at a time. Bounds the memory used by the matrix product when out is a memory-mapped
+        array.
+    out: array
+        Preallocated (n_models, n_wavelength) output, e.g. a np.memmap
+
+    Returns
+    -------
+    z: array
+        (n_models, n_wavelength) increase of the occultation disk of each model, as a function of wavelength
+    '''
+    sigma_trace = np.asarray(sigma_trace, dtype=np.float64)
+    xi = np.atleast_2d(np.asarray(xi, dtype=np.float64))
+    n_models = xi.shape[0]
+
+    # per model constants, the same as z_lambda
+    r_p = r_jovian * np.broadcast_to(planet_radius, (n_models,))
+    pressure = np.broadcast_to(p0, (n_models,)) * 100000
+    mass = np.broadcast_to(mass, (n_models,))
+    T = np.broadcast_to(T, (n_models,))
+    g = np.broadcast_to(g, (n_models,))
+
+    h = scale_h(mass, T, g)
+    tau_eq = 0.56
+    beta = pressure / tau_eq * np.sqrt(2*np.pi*r_p)
+    coefficient = 1/np.sqrt(k*mass*amu_kg*T*g) * beta
+
+    if out is None:
+        out = np.empty((n_models, sigma_trace.shape[-1]))
+    chunk_size = chunk_size or n_models
+
+    for start in range(0, n_models, chunk_size):
+        stop = min(start + chunk_size, n_models)
+        block = out[start:stop]
+        np.matmul(xi[start:stop], sigma_trace, out=block)
+        if sigma_filler is not None:
+            block += (1 - np.sum(xi[start:stop], axis=1))[:, None] * sigma_filler
+        block *= coefficient[start:stop, None]
+        np.log(block, out=block)
+        block *= h[start:stop, None]
+
+    return out